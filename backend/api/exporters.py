@@ -0,0 +1,151 @@
+import csv
+import json
+from io import BytesIO
+
+from django.conf import settings
+from django.db.models import F
+from recipes.models import ShoppingListTotal
+
+SHOPPING_CART_FORMATS = {}
+
+
+def register_format(exporter_class):
+    """Регистрирует формат выгрузки списка покупок."""
+    SHOPPING_CART_FORMATS[exporter_class.extension] = exporter_class
+    return exporter_class
+
+
+def get_shopping_cart_ingredients(user):
+    """Сводный список ингредиентов из списка покупок пользователя.
+    Читается из готовых итогов одним запросом по индексу,
+    время зависит от числа разных ингредиентов, а не рецептов.
+    """
+    return ShoppingListTotal.objects.filter(user=user, total__gt=0).values(
+        'total',
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+    ).order_by('name', 'measurement_unit')
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу возвращает записанное."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartExporter:
+    """Базовый класс формата выгрузки списка покупок.
+    Наследники реализуют `stream`, который по частям выдаёт
+    содержимое файла, не собирая его целиком в памяти.
+    """
+    extension = None
+    content_type = None
+    title = 'Список покупок'
+
+    def __init__(self, ingredients):
+        self.ingredients = ingredients
+
+    def stream(self):
+        raise NotImplementedError
+
+
+@register_format
+class TextExporter(ShoppingCartExporter):
+    extension = 'txt'
+    content_type = 'text/plain; charset=utf-8'
+
+    def stream(self):
+        yield f'{self.title}\n'
+        for item in self.ingredients:
+            yield (f'\n{item["name"]}, {item["total"]}'
+                   f' {item["measurement_unit"]}')
+
+
+@register_format
+class CSVExporter(ShoppingCartExporter):
+    extension = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+
+    def stream(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('Ингредиент', 'Количество', 'Единица'))
+        for item in self.ingredients:
+            yield writer.writerow(
+                (item['name'], item['total'], item['measurement_unit'])
+            )
+
+
+@register_format
+class JSONExporter(ShoppingCartExporter):
+    extension = 'json'
+    content_type = 'application/json'
+
+    def stream(self):
+        separator = ''
+        yield '['
+        for item in self.ingredients:
+            yield separator + json.dumps({
+                'name': item['name'],
+                'amount': item['total'],
+                'measurement_unit': item['measurement_unit'],
+            }, ensure_ascii=False)
+            separator = ','
+        yield ']'
+
+
+@register_format
+class PDFExporter(ShoppingCartExporter):
+    """PDF с разбиением на страницы.
+    Документ собирается reportlab целиком, поэтому память зависит
+    от числа различных ингредиентов, но не от размера корзины.
+    """
+    extension = 'pdf'
+    content_type = 'application/pdf'
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    line_height = 18
+    margin = 56
+
+    def register_font(self):
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_PDF_FONT)
+            )
+
+    def stream(self):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen.canvas import Canvas
+
+        self.register_font()
+        buffer = BytesIO()
+        canvas = Canvas(buffer, pagesize=A4)
+        canvas.setTitle(self.title)
+        width, height = A4
+        top = height - self.margin
+        y = top - self.line_height * 2
+        page = 1
+        canvas.setFont(self.font_name, self.font_size + 4)
+        canvas.drawString(self.margin, top, self.title)
+        canvas.setFont(self.font_name, self.font_size)
+        for item in self.ingredients:
+            if y < self.margin:
+                canvas.drawRightString(width - self.margin,
+                                       self.margin / 2, str(page))
+                canvas.showPage()
+                canvas.setFont(self.font_name, self.font_size)
+                page += 1
+                y = top
+            canvas.drawString(
+                self.margin, y,
+                f'{item["name"]}, {item["total"]} '
+                f'{item["measurement_unit"]}'
+            )
+            y -= self.line_height
+        canvas.drawRightString(width - self.margin, self.margin / 2,
+                               str(page))
+        canvas.save()
+        yield buffer.getvalue()
@@ -0,0 +1,36 @@
+from recipes.images import VARIANT_FORMATS, variant_name
+from rest_framework import serializers
+
+
+class ImageSrcsetField(serializers.ReadOnlyField):
+    """Уменьшенные копии картинки рецепта в формате атрибута `srcset`
+    для каждого формата: {'webp': 'url 320w, url 640w', 'jpeg': ...}.
+    Пустой словарь, если копий нет.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return image_srcset(recipe.image, recipe.image_variants,
+                            self.context.get('request'))
+
+
+def image_srcset(image, variants, request=None):
+    """Значение поля `image_srcset` для картинки `image`
+    (FieldFile) с копиями ширины `variants`.
+    """
+    if not image or not variants:
+        return {}
+    storage = image.storage
+    srcset = {}
+    for key, extension, _ in VARIANT_FORMATS:
+        urls = []
+        for width in variants:
+            url = storage.url(variant_name(image.name, width, extension))
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls.append(f'{url} {width}w')
+        srcset[key] = ', '.join(urls)
+    return srcset
@@ -1,6 +1,9 @@
 import django_filters as filters
 from django.contrib.auth import get_user_model
-from recipes.models import Ingredient, Recipe
+from django.db.models import Exists, OuterRef
+from recipes import cache as reference_cache
+from recipes import search
+from recipes.models import AmountIngredient, Ingredient, Recipe
 
 User = get_user_model()
 
@@ -16,9 +19,23 @@ class IngredientNameFilter(filters.FilterSet):
         fields = ('name', 'measurement_unit')
 
 
+def tag_choices():
+    """Слаги тегов из кэша справочника, без запроса к БД."""
+    return [(slug, slug) for slug in reference_cache.tags.get().slugs()]
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
 class RecipeFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug'
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='get_tags'
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=(('any', 'Любой из тегов'), ('all', 'Все теги')),
+        method='get_tags_mode'
     )
     is_favorited = filters.NumberFilter(
         method='get_is_favorited'
@@ -26,10 +43,35 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.NumberFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
+    ingredients = NumberInFilter(method='get_ingredients')
+    exclude_ingredients = NumberInFilter(method='get_exclude_ingredients')
+    cooking_time_min = filters.NumberFilter(
+        field_name='cooking_time',
+        lookup_expr='gte'
+    )
+    cooking_time_max = filters.NumberFilter(
+        field_name='cooking_time',
+        lookup_expr='lte'
+    )
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['tags', 'tags_mode', 'author', 'is_favorited',
+                  'is_in_shopping_cart', 'search', 'ingredients',
+                  'exclude_ingredients', 'cooking_time_min',
+                  'cooking_time_max']
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        masks = reference_cache.tags.get().masks(value)
+        match_all = self.form.cleaned_data.get('tags_mode') == 'all'
+        return queryset.with_tags(masks, match_all)
+
+    def get_tags_mode(self, queryset, name, value):
+        # Режим применяется в get_tags.
+        return queryset
 
     def get_is_favorited(self, queryset, name, value):
         if value:
@@ -40,3 +82,38 @@ class RecipeFilter(filters.FilterSet):
         if value:
             return queryset.filter(purchases__user=self.request.user)
         return queryset
+
+    def get_ingredients(self, queryset, name, value):
+        """Рецепты, в которых есть все перечисленные ингредиенты.
+        Каждый ингредиент проверяется отдельным EXISTS по индексу
+        (ingredient, recipe).
+        """
+        for ingredient in set(value):
+            queryset = queryset.filter(Exists(
+                AmountIngredient.objects.filter(
+                    recipe=OuterRef('pk'), ingredient=ingredient
+                )
+            ))
+        return queryset
+
+    def get_exclude_ingredients(self, queryset, name, value):
+        """Рецепты без перечисленных ингредиентов."""
+        if not value:
+            return queryset
+        return queryset.exclude(Exists(
+            AmountIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient__in=value
+            )
+        ))
+
+    def get_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, описанию и ингредиентам,
+        более релевантные рецепты первыми.
+        """
+        value = value.strip()
+        if not value:
+            return queryset
+        queryset = search.search(queryset, value)
+        if 'search_rank' in queryset.query.annotations:
+            queryset = queryset.order_by('-search_rank', '-pub_date', '-id')
+        return queryset
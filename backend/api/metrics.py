@@ -0,0 +1,321 @@
+"""Метрики запросов: время в БД, сериализации и отрисовке,
+число SQL-запросов и размер ответа по маршрутам.
+Значения копятся в гистограммах процесса и отдаются на /metrics
+в текстовом формате Prometheus. Замеры запросов ведутся только
+при `METRICS_ENABLED`, счётчик кэша ответов — всегда.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('foodgram_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Замеры одного запроса. Время частей (`timings`) не включает
+    время запросов к БД внутри них.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.timings = {}
+        self.marks = {}
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def server_timing(self, total):
+        parts = [f'db;dur={self.db * 1000:.1f};desc="{self.queries} SQL"']
+        parts.extend(
+            f'{name};dur={seconds * 1000:.1f}'
+            for name, seconds in self.timings.items()
+        )
+        parts.extend(
+            f'{name};desc="{value}"' for name, value in self.marks.items()
+        )
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def current():
+    """Замеры текущего запроса или None, если метрики выключены."""
+    return _current.get()
+
+
+def start():
+    """Начинает замеры запроса. Возвращает замеры и токен для `stop`."""
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+@contextmanager
+def measure(name):
+    """Добавляет время блока к части `name` замеров запроса."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started, db = time.perf_counter(), metrics.db
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - started - (metrics.db - db))
+
+
+def count_cache(name, hit):
+    """Учитывает попадание или промах кэша ответов `name`.
+    Счётчик ведётся и при выключенных `METRICS_ENABLED`,
+    в `Server-Timing` результат попадает только при включённых.
+    """
+    result = 'hit' if hit else 'miss'
+    REGISTRY.count_cache(name, result)
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.marks['cache'] = result
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def add_execute_wrapper(connection, **kwargs):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def install():
+    """Подключает учёт запросов ко всем соединениям с БД, в том числе
+    к соединениям потоков, которые откроются позже.
+    """
+    connection_created.connect(add_execute_wrapper,
+                               dispatch_uid='foodgram_metrics')
+    for connection in connections.all():
+        add_execute_wrapper(connection)
+
+
+def timed(serializer):
+    """Учитывает вывод данных сериализатора в части `serialize`."""
+    if _current.get() is None:
+        return serializer
+    to_representation = serializer.to_representation
+
+    def timed_representation(instance):
+        with measure('serialize'):
+            return to_representation(instance)
+
+    serializer.to_representation = timed_representation
+    return serializer
+
+
+class SerializerTimingMixin:
+    """Замеряет время сериализации ответов ViewSet."""
+
+    def get_serializer(self, *args, **kwargs):
+        return timed(super().get_serializer(*args, **kwargs))
+
+
+def escape(value):
+    return (str(value).replace('\\', r'\\').replace('\n', r'\n')
+            .replace('"', r'\"'))
+
+
+def format_labels(names, values, extra=''):
+    labels = [f'{name}="{escape(value)}"'
+              for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series = {}
+
+    def observe(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def samples(self):
+        for labels, value in sorted(self.series.items()):
+            yield (f'{self.name}{format_labels(self.labels, labels)} '
+                   f'{format_value(value)}')
+
+
+class Histogram(Counter):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels, buckets):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                yield (f'{self.name}_bucket'
+                       f'{format_labels(self.labels, labels, le)} '
+                       f'{cumulative}')
+            label_text = format_labels(self.labels, labels)
+            yield f'{self.name}_sum{label_text} {format_value(total)}'
+            yield f'{self.name}_count{label_text} {cumulative}'
+
+
+class Registry:
+    """Метрики процесса. При нескольких процессах каждый отдаёт
+    на /metrics свои значения.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.create()
+
+    def create(self):
+        route = ('route', 'method')
+        self.cache = Counter(
+            'foodgram_response_cache_total',
+            'Обращения к кэшу ответов: hit — попадание, miss — промах.',
+            ('view', 'result'),
+        )
+        self.requests = Counter(
+            'foodgram_requests_total', 'Количество запросов.',
+            route + ('status',),
+        )
+        self.metrics = {
+            'duration': Histogram(
+                'foodgram_request_duration_seconds',
+                'Время обработки запроса.', route, DURATION_BUCKETS,
+            ),
+            'db': Histogram(
+                'foodgram_db_duration_seconds',
+                'Время запросов к БД за запрос.', route, DURATION_BUCKETS,
+            ),
+            'queries': Histogram(
+                'foodgram_db_queries', 'Количество SQL-запросов за запрос.',
+                route, QUERY_BUCKETS,
+            ),
+            'serialize': Histogram(
+                'foodgram_serialize_duration_seconds',
+                'Время сериализации ответа без запросов к БД.', route,
+                DURATION_BUCKETS,
+            ),
+            'render': Histogram(
+                'foodgram_render_duration_seconds',
+                'Время отрисовки ответа.', route, DURATION_BUCKETS,
+            ),
+            'size': Histogram(
+                'foodgram_response_size_bytes', 'Размер тела ответа.',
+                route, SIZE_BUCKETS,
+            ),
+        }
+
+    def clear(self):
+        with self.lock:
+            self.create()
+
+    def observe(self, route, method, status, metrics, total, size):
+        labels = (route, method)
+        with self.lock:
+            self.requests.observe(labels + (str(status),))
+            self.metrics['duration'].observe(labels, total)
+            self.metrics['db'].observe(labels, metrics.db)
+            self.metrics['queries'].observe(labels, metrics.queries)
+            for name, seconds in metrics.timings.items():
+                if name in self.metrics:
+                    self.metrics[name].observe(labels, seconds)
+            if size is not None:
+                self.metrics['size'].observe(labels, size)
+
+    def count_cache(self, name, result):
+        with self.lock:
+            self.cache.observe((name, result))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for metric in (self.requests, self.cache,
+                           *self.metrics.values()):
+                lines.append(f'# HELP {metric.name} {metric.documentation}')
+                lines.append(f'# TYPE {metric.name} {metric.type}')
+                lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def route_label(request):
+    """Шаблон маршрута без якорей регулярных выражений,
+    чтобы число рядов метрик не зависело от id в адресах.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None or match.route is None:
+        return 'unmatched'
+    return match.route.replace('^', '').replace('$', '')
+
+
+def metrics_view(request):
+    """Метрики для Prometheus. Отдаются только с заголовком
+    `Authorization: Bearer <METRICS_TOKEN>`; без токена в настройках
+    адрес закрыт. При выключенных `METRICS_ENABLED` в ответе есть
+    только счётчик кэша ответов.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    authorization = request.headers.get('Authorization', '')
+    if not constant_time_compare(authorization,
+                                 f'Bearer {settings.METRICS_TOKEN}'):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Заголовок Server-Timing и метрики для /metrics.
+    При `METRICS_ENABLED = False` исключается из цепочки целиком.
+    Работает и под WSGI, и под ASGI без перехода в другой поток.
+    """
+    if not settings.METRICS_ENABLED:
+        raise MiddlewareNotUsed
+    metrics.install()
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            request_metrics, token = metrics.start()
+            try:
+                response = await get_response(request)
+            finally:
+                metrics.stop(token)
+            return finish(request, response, request_metrics)
+    else:
+        def middleware(request):
+            request_metrics, token = metrics.start()
+            try:
+                response = get_response(request)
+            finally:
+                metrics.stop(token)
+            return finish(request, response, request_metrics)
+
+    middleware.process_template_response = (
+        RenderTiming().process_template_response
+    )
+    return middleware
+
+
+class RenderTiming:
+    """Учитывает отрисовку отложенных ответов в части `render`.
+    Django ищет `process_template_response` у middleware и ждёт
+    от него связанный метод, поэтому хук вынесен в класс.
+    """
+
+    def process_template_response(self, request, response):
+        render = response.render
+
+        def timed_render():
+            with metrics.measure('render'):
+                return render()
+
+        response.render = timed_render
+        return response
+
+
+def finish(request, response, request_metrics):
+    total = time.perf_counter() - request_metrics.started
+    response['Server-Timing'] = request_metrics.server_timing(total)
+    route = metrics.route_label(request)
+    if route != 'metrics':
+        metrics.REGISTRY.observe(
+            route, request.method, response.status_code,
+            request_metrics, total,
+            None if response.streaming else len(response.content),
+        )
+    return response
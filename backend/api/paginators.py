@@ -1,8 +1,186 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class PageLimitPagination(PageNumberPagination):
     """Стандартный пагинатор с определением атрибута
     `page_size_query_param`, для вывода запрошенного количества страниц.
+
+    При наличии в запросе параметра `cursor` включается режим
+    курсорной (keyset) пагинации: страница выбирается условием по ключу
+    сортировки, без `OFFSET` и без подсчёта общего количества объектов.
+    Первая страница запрашивается с пустым курсором (`?cursor=`).
     """
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_queryset_by_cursor(queryset, request)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_ordering(self, queryset):
+        """Порядок выдачи с уникальным первичным ключом в конце,
+        чтобы ключ сортировки однозначно задавал позицию курсора.
+        """
+        ordering = list(
+            queryset.query.order_by or queryset.model._meta.ordering
+        )
+        names = {field.lstrip('-') for field in ordering}
+        if not names & {'pk', 'id', queryset.model._meta.pk.name}:
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        return ordering
+
+    def paginate_queryset_by_cursor(self, queryset, request):
+        self.page_size = self.get_page_size(request)
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        position, reverse = self.decode_cursor(request, queryset)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results:
+            if has_more or reverse:
+                self.next_position = self.get_position(results[-1])
+            if position is not None and (has_more or not reverse):
+                self.previous_position = self.get_position(results[0])
+        return results
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def after(ordering, position):
+        """Условие «строго после позиции» для составного ключа:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def get_position(self, obj):
+        position = []
+        for field in self.ordering:
+            value = obj
+            for name in field.lstrip('-').split(LOOKUP_SEP):
+                value = getattr(value, name, None)
+            position.append(value)
+        return position
+
+    @staticmethod
+    def resolve_field(queryset, name):
+        """Поле, по которому разбирается значение ключа из курсора:
+        аннотация queryset, поле модели или поле связанной модели
+        через `__`.
+        """
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        opts = queryset.model._meta
+        *path, name = name.split(LOOKUP_SEP)
+        for part in path:
+            related_model = opts.get_field(part).related_model
+            if related_model is None:
+                raise FieldDoesNotExist(part)
+            opts = related_model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def encode_cursor(self, position, reverse):
+        if position is None:
+            return None
+        payload = {
+            'p': [
+                value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in position
+            ],
+        }
+        if reverse:
+            payload['r'] = 1
+        cursor = urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode()
+        ).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, queryset):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor.encode()))
+            raw_position = payload['p']
+            if len(raw_position) != len(self.ordering):
+                raise ValueError
+            position = []
+            for field, value in zip(self.ordering, raw_position):
+                model_field = self.resolve_field(queryset, field.lstrip('-'))
+                position.append(model_field.to_python(value))
+        except (TypeError, ValueError, KeyError, ValidationError,
+                FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(payload.get('r'))
+
+
+class KeysetPagination(PageLimitPagination):
+    """Только курсорная пагинация, без `OFFSET` и `COUNT`.
+    Порядок задаёт сам queryset, и последнее поле в нём должно
+    быть уникальным: первичный ключ не добавляется, поэтому курсор
+    подходит к разным querysets с одинаковым ключом сортировки.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = True
+        return self.paginate_queryset_by_cursor(queryset, request)
+
+    def get_ordering(self, queryset):
+        return list(queryset.query.order_by)
@@ -0,0 +1,38 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же результатом, что и у DRF:
+    компактный вывод без экранирования не-ASCII символов.
+    Даты, Decimal, ленивые строки и другие типы, которые orjson
+    не знает или выводит иначе, передаются кодировщику DRF.
+    Отступы (`indent` в Accept), экранирование не-ASCII и данные,
+    которые orjson вывести не может (например, целые больше 64 бит),
+    отрисовываются самим JSONRenderer.
+    """
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if (
+            self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type,
+                               renderer_context) is not None
+        ):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        try:
+            content = orjson.dumps(data, default=self.encoder_class().default,
+                                   option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        # Как и JSONRenderer, экранируем разделители строк, которые
+        # допустимы в JSON, но не в JavaScript.
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029'
+        )
@@ -0,0 +1,109 @@
+"""Вывод списков рецептов и пользователей без сериализаторов.
+Словари собираются из строк `values_list` напрямую и совпадают
+с выводом `ListRecipeSerializer` и `UserSerializer` поле в поле,
+в том же порядке ключей. Поля сериализаторов, которые выводятся
+здесь, нужно менять в обоих местах: это проверяет тест
+`RepresentationParityTest`.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from recipes import memberships
+from recipes.models import AmountIngredient, Recipe
+
+from .fields import image_srcset
+
+User = get_user_model()
+
+USER_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit', 'amount')
+
+
+def user_data(user, following):
+    """Вывод `UserSerializer` для экземпляра пользователя."""
+    data = {name: getattr(user, name) for name in USER_FIELDS}
+    if hasattr(user, 'is_subscribed'):
+        data['is_subscribed'] = user.is_subscribed
+    else:
+        data['is_subscribed'] = user.id in following
+    return data
+
+
+def users(page, request):
+    following = memberships.for_request(request).following
+    return [user_data(user, following) for user in page]
+
+
+def authors_map(ids, following):
+    authors = {}
+    for row in User.objects.filter(id__in=ids).values(*USER_FIELDS):
+        row['is_subscribed'] = row['id'] in following
+        authors[row['id']] = row
+    return authors
+
+
+def tags_map(recipe_ids):
+    tags = defaultdict(list)
+    rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag__name').values_list(
+        'recipe_id', *(f'tag__{name}' for name in TAG_FIELDS)
+    )
+    for recipe_id, *values in rows:
+        tags[recipe_id].append(dict(zip(TAG_FIELDS, values)))
+    return tags
+
+
+def ingredients_map(recipe_ids):
+    ingredients = defaultdict(list)
+    rows = AmountIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('pk').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount',
+    )
+    for recipe_id, *values in rows:
+        ingredients[recipe_id].append(dict(zip(INGREDIENT_FIELDS, values)))
+    return ingredients
+
+
+def image_url(image, request):
+    if not image:
+        return None
+    if request is None:
+        return image.url
+    return request.build_absolute_uri(image.url)
+
+
+def recipes(page, request):
+    """Вывод `ListRecipeSerializer` для страницы рецептов.
+    Рецептам не нужны `with_related`: теги, ингредиенты и авторы
+    читаются тремя запросами на всю страницу.
+    """
+    recipe_ids = [recipe.id for recipe in page]
+    if not recipe_ids:
+        return []
+    user_memberships = memberships.for_request(request)
+    authors = authors_map({recipe.author_id for recipe in page},
+                          user_memberships.following)
+    tags = tags_map(recipe_ids)
+    ingredients = ingredients_map(recipe_ids)
+    return [
+        {
+            'id': recipe.id,
+            'tags': tags.get(recipe.id, []),
+            'author': authors.get(recipe.author_id),
+            'ingredients': ingredients.get(recipe.id, []),
+            'is_favorited': recipe.id in user_memberships.favorites,
+            'is_in_shopping_cart':
+                recipe.id in user_memberships.shopping_cart,
+            'name': recipe.name,
+            'image': image_url(recipe.image, request),
+            'image_srcset': image_srcset(recipe.image,
+                                         recipe.image_variants, request),
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+        for recipe in page
+    ]
@@ -0,0 +1,51 @@
+"""Общий кэш ответов для анонимных GET-запросов.
+Ключ включает ETag ответа, а ETag — версии наборов данных, поэтому
+после любого изменения рецептов, тегов, ингредиентов или
+пользователей старые записи больше не читаются и истекают сами.
+"""
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+KEY = 'foodgram:response:{}:{}'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def normalize_query(query_params):
+    """Параметры запроса без пустых значений, отсортированные по имени
+    и значению: `?tags=b&tags=a&page=2` и `?page=2&tags=a&tags=b`
+    дают одну запись.
+    """
+    return '&'.join(
+        f'{name}={value}'
+        for name in sorted(query_params)
+        for value in sorted(query_params.getlist(name))
+        if value != ''
+    )
+
+
+def make_key(request, name, etag):
+    # Хост входит в ключ, потому что ссылки пагинации абсолютные.
+    digest = md5('\n'.join((
+        request.scheme, request.get_host(), request.path, etag,
+        normalize_query(request.query_params),
+    )).encode()).hexdigest()
+    return KEY.format(name, digest)
+
+
+def load(request, name, etag):
+    """Данные ответа из кэша или None."""
+    data = get_cache().get(make_key(request, name, etag))
+    metrics.count_cache(name, data is not None)
+    return data
+
+
+def store(request, name, etag, data):
+    get_cache().set(make_key(request, name, etag), data,
+                    settings.RESPONSE_CACHE_TIMEOUT)
@@ -1,25 +1,69 @@
+from collections.abc import Mapping
+from contextvars import ContextVar
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
-from django.shortcuts import get_object_or_404
-from drf_extra_fields.fields import Base64ImageField
-from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import Http404
+from drf_extra_fields.fields import Base64FileField, Base64ImageField
+from recipes import cache as reference_cache
+from recipes import memberships, totals
+from recipes.images import pipeline
+from recipes.models import (AmountIngredient, Favorite, ImageStatus,
+                            Ingredient, Recipe, RecipeQuerySet,
                             ShoppingList, Tag)
 from rest_framework import serializers
 from users.serializers import UserSerializer
 
+from .fields import ImageSrcsetField
+
 User = get_user_model()
 
 
+class DeferredBase64ImageField(Base64FileField):
+    """ Картинка в base64, которая не декодируется в запросе.
+    Тип определяется по сигнатуре файла, полная проверка
+    и обработка выполняются в `recipes.images`.
+    """
+    ALLOWED_TYPES = ('jpg', 'png', 'gif', 'webp')
+    INVALID_FILE_MESSAGE = Base64ImageField.INVALID_FILE_MESSAGE
+    INVALID_TYPE_MESSAGE = Base64ImageField.INVALID_TYPE_MESSAGE
+    SIGNATURES = (
+        (b'\xff\xd8\xff', 'jpg'),
+        (b'\x89PNG\r\n\x1a\n', 'png'),
+        (b'GIF87a', 'gif'),
+        (b'GIF89a', 'gif'),
+    )
+    default_error_messages = {
+        'too_large': 'Размер картинки не должен превышать {max_size} Мб.',
+    }
+
+    def get_file_extension(self, filename, decoded_file):
+        if len(decoded_file) > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+            self.fail('too_large', max_size=(
+                settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE // (1024 * 1024)
+            ))
+        if decoded_file[:4] == b'RIFF' and decoded_file[8:12] == b'WEBP':
+            return 'webp'
+        for signature, extension in self.SIGNATURES:
+            if decoded_file.startswith(signature):
+                return extension
+        return None
+
+
 class SimpleRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Recipe.
     Минимальный набор полей для определенных эндпоинтов.
     """
 
     image = Base64ImageField(max_length=None, use_url=True)
+    image_srcset = ImageSrcsetField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -27,7 +71,29 @@ class TagSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Tag
-        fields = '__all__'
+        fields = ('id', 'name', 'color', 'slug')
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """ Поле первичного ключа справочника.
+    Объект ищется в кэше справочника без запроса к БД.
+    """
+
+    def __init__(self, reference_cache, **kwargs):
+        self.reference_cache = reference_cache
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = self.reference_cache.get().get(pk)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
 
 
 class TagListField(serializers.RelatedField):
@@ -42,7 +108,12 @@ class TagListField(serializers.RelatedField):
         }
 
     def to_internal_value(self, data):
-        tag = get_object_or_404(Tag, id=data)
+        try:
+            tag = reference_cache.tags.get().get(int(data))
+        except (TypeError, ValueError):
+            tag = None
+        if tag is None:
+            raise Http404
         return tag
 
 
@@ -57,7 +128,8 @@ class IngredientSerializer(serializers.ModelSerializer):
 class IngredientsAmountSerializer(serializers.ModelSerializer):
     """ Сериализатор для модели AmountIngredient."""
 
-    id = serializers.PrimaryKeyRelatedField(
+    id = CachedPrimaryKeyRelatedField(
+        reference_cache.ingredients,
         queryset=Ingredient.objects.all(),
         source='ingredient'
     )
@@ -71,36 +143,39 @@ class IngredientsAmountSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class IngredientsAmountReadSerializer(serializers.ModelSerializer):
-    """ Сериализатор для модели AmountIngredient на чтение."""
+class RecipeUserFlagsMixin:
+    """ Флаги избранного и списка покупок для текущего пользователя.
+    Берутся из множеств пользователя, загружаемых один раз за запрос.
+    """
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient'
-    )
-    name = serializers.ReadOnlyField(source='ingredient.name')
-    measurement_unit = serializers.ReadOnlyField(
-        source='ingredient.measurement_unit'
-    )
-    
-    class Meta:
-        model = AmountIngredient
-        fields = ('id', 'name', 'measurement_unit', 'amount')
+    def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return obj.id in memberships.for_request(
+            self.context.get('request')
+        ).favorites
 
-    def to_representation(self, instance):
-        data = IngredientSerializer(instance).data
-        return data
+    def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return obj.id in memberships.for_request(
+            self.context.get('request')
+        ).shopping_cart
 
 
-class ListRecipeSerializer(serializers.ModelSerializer):
+class ListRecipeSerializer(RecipeUserFlagsMixin,
+                           serializers.ModelSerializer):
     """ Сериализатор для получения списка рецептов."""
 
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
-    ingredients = IngredientsAmountReadSerializer(
+    ingredients = IngredientsAmountSerializer(
         many=True,
+        read_only=True,
+        source='recipes_amount',
     )
     image = Base64ImageField(max_length=None, use_url=True)
+    image_srcset = ImageSrcsetField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -115,35 +190,81 @@ class ListRecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_srcset',
             'text',
             'cooking_time',
         )
         read_only_fields = ('author', 'tags',)
 
-    def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request.user.is_authenticated:
-            return Favorite.objects.filter(user=request.user,
-                                           recipe=obj).exists()
-        return False
 
-    def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request.user.is_authenticated:
-            return ShoppingList.objects.filter(user=request.user,
-                                           recipe=obj).exists()
-        return False
+_plan_context = ContextVar('serializer_plan_context', default=None)
+
+
+class CurrentContext(Mapping):
+    """Контекст сериализатора, который сейчас выводит данные
+    по общему плану полей. Свой для каждого потока и задачи.
+    """
+
+    def current(self):
+        return _plan_context.get() or {}
+
+    def __getitem__(self, key):
+        return self.current()[key]
+
+    def __iter__(self):
+        return iter(self.current())
+
+    def __len__(self):
+        return len(self.current())
+
+
+class FieldPlanMixin:
+    """ Сериализатор только для вывода с общим для класса планом полей.
+    Поля, включая вложенные сериализаторы, строятся один раз
+    на экземпляре-образце, а не при каждом создании сериализатора.
+    Контекст запроса поля образца получают через `CurrentContext`.
+    """
+
+    @classmethod
+    def get_plan(cls):
+        plan = cls.__dict__.get('_field_plan')
+        if plan is None:
+            prototype = cls(context=CurrentContext())
+            plan = cls._field_plan = tuple(prototype._readable_fields)
+        return plan
+
+    @property
+    def _readable_fields(self):
+        if isinstance(self._context, CurrentContext):
+            return super()._readable_fields
+        return self.get_plan()
+
+    def to_representation(self, instance):
+        token = _plan_context.set(self.context)
+        try:
+            return super().to_representation(instance)
+        finally:
+            _plan_context.reset(token)
+
+
+class RecipeDetailSerializer(FieldPlanMixin, ListRecipeSerializer):
+    """ Сериализатор для получения рецепта.
+    Теги, ингредиенты и автор берутся из `Recipe.objects.with_related`.
+    """
 
 
-class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
+class CreateUpdateRecipeSerializer(RecipeUserFlagsMixin,
+                                   serializers.ModelSerializer):
     """ Сериализатор для создания, получения и обновления рецепта."""
 
     author = UserSerializer(read_only=True)
     ingredients = IngredientsAmountSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = CachedPrimaryKeyRelatedField(
+        reference_cache.tags,
         many=True,
         queryset=Tag.objects.all())
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = DeferredBase64ImageField(max_length=None, use_url=True)
+    image_srcset = ImageSrcsetField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -158,12 +279,15 @@ class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_srcset',
             'text',
             'cooking_time',
         )
 
     def validate(self, data):
-        list_ingr = [item['ingredient'] for item in data['ingredients']]
+        list_ingr = [
+            item['ingredient'] for item in data.get('ingredients', [])
+        ]
         all_ingredients, distinct_ingredients = (
             len(list_ingr), len(set(list_ingr)))
 
@@ -173,55 +297,94 @@ class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
             )
         return data
 
-    def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request.user.is_authenticated:
-            return Favorite.objects.filter(user=request.user,
-                                           recipe=obj).exists()
-        return False
+    def set_ingredients(self, recipe, ingredients, existing=None):
+        """Приводит ингредиенты рецепта к переданному списку.
+        Изменения вносятся пакетно: одним удалением, одним
+        `bulk_update` и одним `bulk_create`. Возвращает изменения
+        количеств добавленных и изменённых ингредиентов для итогов
+        списков покупок: `bulk_*` не посылают сигналов, а удаление
+        учитывается сигналом.
+        """
+        amounts = {
+            item['ingredient'].id: item['amount'] for item in ingredients
+        }
+        if existing is None:
+            existing = {
+                row.ingredient_id: row
+                for row in AmountIngredient.objects.filter(recipe=recipe)
+            }
+        removed = [
+            row.id for ingredient_id, row in existing.items()
+            if ingredient_id not in amounts
+        ]
+        changed = []
+        deltas = {}
+        for ingredient_id, row in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                deltas[ingredient_id] = amount - row.amount
+                row.amount = amount
+                changed.append(row)
+        created = [
+            AmountIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ]
+        if removed:
+            AmountIngredient.objects.filter(id__in=removed).delete()
+        if changed:
+            AmountIngredient.objects.bulk_update(changed, ('amount',))
+        if created:
+            AmountIngredient.objects.bulk_create(created)
+            deltas.update(
+                (row.ingredient_id, row.amount) for row in created
+            )
+        if hasattr(recipe, '_prefetched_objects_cache'):
+            recipe._prefetched_objects_cache.pop('recipes_amount', None)
+        return deltas
 
-    def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request.user.is_authenticated:
-            return ShoppingList.objects.filter(user=request.user,
-                                           recipe=obj).exists()
-        return False
-
-    def create_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            AmountIngredient.objects.create(
-                recipe=recipe,
-                ingredient=ingredient["ingredient"],
-                amount=ingredient.get('amount'), )
-            
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
-        image = validated_data.pop('image')
-        text = validated_data.pop('text')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(image=image, text=text, **validated_data)
+        validated_data['image_status'] = ImageStatus.PENDING
+        recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        self.create_ingredients(ingredients, recipe)
+        self.set_ingredients(recipe, ingredients, existing={})
+        pipeline.schedule(recipe.id)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        instance.tags.set(tags)
-        self.create_ingredients(ingredients, instance)
-        instance.save()
-        return super().update(instance, validated_data)
-
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        new_image = validated_data.get('image') is not None
+        previous = None
+        if new_image:
+            previous = pipeline.replaced(instance)
+            validated_data['image_status'] = ImageStatus.PENDING
+            validated_data['image_variants'] = []
+        # Записываются только переданные поля: картинку и её статус
+        # параллельно меняет обработка картинок.
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=(*validated_data, 'updated_at'))
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            totals.change_recipe(
+                instance.id, self.set_ingredients(instance, ingredients)
+            )
+        if new_image:
+            pipeline.schedule(instance.id, previous)
+        return instance
 
     def to_representation(self, obj):
-        self.fields.pop('ingredients')
-        self.fields['tags'] = TagSerializer(many=True)
-        representation = super().to_representation(obj)
-        representation['ingredients'] = IngredientsAmountSerializer(
-            AmountIngredient.objects.filter(recipe=obj).all(), many=True
-        ).data
-        return representation    
+        # Подгружается только то, что не загружено или сброшено
+        # при сохранении тегов и ингредиентов.
+        prefetch_related_objects([obj], *RecipeQuerySet.related_lookups())
+        return RecipeDetailSerializer(obj, context=self.context).data
 
 
 class FavoritesSerializer(serializers.ModelSerializer):
@@ -1,49 +1,184 @@
+from hashlib import md5
+
 from django.contrib.auth import get_user_model
-from django.db.models.aggregates import Sum
-from django.http.response import HttpResponse
-from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
+from django.http import Http404
+from django.http.response import StreamingHttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from recipes import cache as reference_cache
+from recipes import feed
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
                             ShoppingList, Tag)
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from . import representations, response_cache
+from .exporters import SHOPPING_CART_FORMATS, get_shopping_cart_ingredients
 from .filters import IngredientNameFilter, RecipeFilter
-from .paginators import PageLimitPagination
+from .metrics import SerializerTimingMixin, measure
+from .paginators import KeysetPagination, PageLimitPagination
 from .permissions import OwnerOrAdminOrReadOnly
 from .serializers import (CreateUpdateRecipeSerializer, FavoritesSerializer,
                           IngredientSerializer, ListRecipeSerializer,
-                          ShoppingListSerializer, TagSerializer)
+                          RecipeDetailSerializer, ShoppingListSerializer,
+                          TagSerializer)
 
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class ConditionalGetMixin:
+    """Условные GET-запросы для `list` и `retrieve`.
+    ETag и Last-Modified строятся по версиям наборов данных
+    из `get_version_names`, поэтому на `If-None-Match`
+    и `If-Modified-Since` ответ 304 отдаётся без запросов к БД
+    и без сериализации. Данные ответов анонимным пользователям
+    хранятся в общем кэше ответов под тем же ETag.
+    """
+    version_names = ()
+    user_dependent = False
+    cache_anonymous = True
+
+    def get_version_names(self):
+        names = list(self.version_names)
+        user = self.request.user
+        if self.user_dependent and user.is_authenticated:
+            names.append(reference_cache.user_version(user.id))
+        return names
+
+    def get_validators(self):
+        """ETag и Last-Modified (timestamp) текущего ответа."""
+        versions, modified = reference_cache.get_state(
+            self.get_version_names()
+        )
+        parts = [str(self.request.user.pk)]
+        parts.extend(str(version) for version in versions)
+        etag = quote_etag(md5(':'.join(parts).encode()).hexdigest())
+        return etag, int(modified)
+
+    @staticmethod
+    def set_validators(response, etag, last_modified):
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, no_cache=True)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    def conditional(self, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = self.cached(handler, request, etag, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    def cached(self, handler, request, etag, *args, **kwargs):
+        if not self.cache_anonymous or request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        data = response_cache.load(request, self.basename, etag)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.store(request, self.basename, etag, response.data)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+
+class ReferenceCacheMixin:
+    """Отдаёт список и отдельные объекты справочника из кэша
+    процесса, не обращаясь к БД.
+    """
+    reference_cache = None
+
+    def get_catalog_ids(self, catalog):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        catalog = self.reference_cache.get()
+        return Response(catalog.as_list(self.get_catalog_ids(catalog)))
+
+    def retrieve(self, request, *args, **kwargs):
+        catalog = self.reference_cache.get()
+        try:
+            pk = int(kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        if pk not in catalog:
+            raise Http404
+        return Response(catalog.as_dict(pk))
+
+
+class TagViewSet(SerializerTimingMixin, ConditionalGetMixin,
+                 ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    reference_cache = reference_cache.tags
+    version_names = ('tags',)
 
 
-class IngredientsViewSet(viewsets.ModelViewSet):
+class IngredientsViewSet(SerializerTimingMixin, ConditionalGetMixin,
+                         ReferenceCacheMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
     filterset_class = IngredientNameFilter
     pagination_class = None
+    reference_cache = reference_cache.ingredients
+    version_names = ('ingredients',)
+    autocomplete_limit = 50
+
+    def get_catalog_ids(self, catalog):
+        params = self.request.query_params
+        name = params.get('name')
+        measurement_unit = params.get('measurement_unit')
+        if name:
+            return catalog.search(name, measurement_unit,
+                                  self.autocomplete_limit)
+        if measurement_unit:
+            return [
+                pk for pk in catalog.order
+                if catalog.rows[pk][1] == measurement_unit
+            ]
+        return None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SerializerTimingMixin, ConditionalGetMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     pagination_class = PageLimitPagination
     permission_classes = (OwnerOrAdminOrReadOnly,)
     filterset_class = RecipeFilter
     serializer_classes = {
         'list': ListRecipeSerializer,
-        'retrieve': CreateUpdateRecipeSerializer,
+        'retrieve': RecipeDetailSerializer,
     }
     default_serializer_class = CreateUpdateRecipeSerializer
+    # Рецепт включает теги, ингредиенты и автора, а также отметки
+    # текущего пользователя: избранное, список покупок, подписку.
+    version_names = ('tags', 'ingredients', 'users')
+    user_dependent = True
+
+    def get_version_names(self):
+        names = super().get_version_names()
+        if self.action == 'retrieve':
+            names.append(reference_cache.recipe_version(self.kwargs['pk']))
+        else:
+            names.append('recipes')
+        return names
 
     def get_serializer_class(self):
         return self.serializer_classes.get(
@@ -51,6 +186,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
             self.default_serializer_class
         )
 
+    def get_queryset(self):
+        if self.action == 'retrieve':
+            return Recipe.objects.with_related()
+        return super().get_queryset()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self.list_recipes, request, *args, **kwargs)
+
+    def list_recipes(self, request, *args, **kwargs):
+        """Список рецептов без `ListRecipeSerializer`: вывод
+        собирается в `representations.recipes`.
+        """
+        page = self.paginate_queryset(self.filter_queryset(
+            self.get_queryset()
+        ))
+        with measure('serialize'):
+            data = representations.recipes(page, request)
+        return self.get_paginated_response(data)
+
     def perform_create(self, serializer):
         return serializer.save(author=self.request.user)
 
@@ -113,26 +267,40 @@ class RecipeViewSet(viewsets.ModelViewSet):
             request, ShoppingList, pk
         )
 
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        return self.conditional(self.list_feed, request)
+
+    def list_feed(self, request):
+        """Рецепты авторов из подписок, новые первыми.
+        Стратегию чтения выбирает `recipes.feed` по числу подписок.
+        """
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(feed.recipes(request.user),
+                                           request, view=self)
+        if page and isinstance(page[0], FeedEntry):
+            page = [entry.recipe for entry in page]
+        with measure('serialize'):
+            data = representations.recipes(page, request)
+        return paginator.get_paginated_response(data)
+
     @action(detail=False, methods=['get',],
             permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
         user = self.request.user
-        queryset = self.get_queryset()
-        carts = ShoppingList.objects.filter(user=request.user)
-        recipes = queryset.filter(purchases__in=carts)
-        ingredients = AmountIngredient.objects.filter(recipe__in=recipes)
-        ing_types = Ingredient.objects.filter(
-            ingredients_amount__in=ingredients
-        ).annotate(total=Sum('ingredients_amount__amount'))
-
-        response_content = (
-            'Список покупок\n\n'
+        file_format = request.query_params.get('file_format', 'txt')
+        exporter_class = SHOPPING_CART_FORMATS.get(file_format)
+        if exporter_class is None:
+            raise ValidationError({
+                'file_format': 'Доступные форматы: '
+                               f'{", ".join(SHOPPING_CART_FORMATS)}.'
+            })
+        exporter = exporter_class(
+            get_shopping_cart_ingredients(user).iterator()
+        )
+        filename = f'{user.username}_shopping_list.{exporter.extension}'
+        response = StreamingHttpResponse(
+            exporter.stream(), content_type=exporter.content_type
         )
-
-        lines = [f'{ing_type.name}, {ing_type.total}'
-                 f' {ing_type.measurement_unit}' for ing_type in ing_types]
-        filename = f'{user.username}_shopping_list.txt'
-        response_content += '\n'.join(lines)
-        response = HttpResponse(response_content, content_type='text/plain')
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -86,6 +87,27 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    },
+    # Кэш ответов анонимным пользователям (api.response_cache).
+    # В продакшене — общий для процессов бэкенд: файловый или Redis.
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION', default='foodgram-responses'
+        ),
+    },
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -123,6 +145,45 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
+RECIPE_IMAGE_MAX_DIMENSION = int(
+    os.getenv('RECIPE_IMAGE_MAX_DIMENSION', default=1600)
+)
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+RECIPE_IMAGE_QUEUE_SIZE = int(
+    os.getenv('RECIPE_IMAGE_QUEUE_SIZE', default=32)
+)
+RECIPE_IMAGE_SYNC = False
+RECIPE_IMAGE_VARIANT_WIDTHS = (320, 640, 960)
+
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(
+    os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=100000)
+)
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_TIMEOUT', default=5 * 60)
+)
+
+# С этого числа подписок лента рецептов (/api/recipes/feed/) хранится
+# готовой и пополняется при публикации рецептов. После изменения
+# выполните `python manage.py rebuild_feeds`.
+FEED_TIMELINE_THRESHOLD = int(
+    os.getenv('FEED_TIMELINE_THRESHOLD', default=100)
+)
+
+# Заголовок Server-Timing и метрики Prometheus на /metrics.
+# Счётчик кэша ответов ведётся и без этой настройки.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='False') == 'True'
+# Токен для /metrics (заголовок Authorization: Bearer <токен>).
+# Пока он не задан, метрики по адресу не отдаются.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -132,6 +193,17 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
 
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
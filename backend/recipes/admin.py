@@ -1,7 +1,10 @@
 from django.contrib import admin
 from import_export.admin import ImportExportModelAdmin
 
-from .models import AmountIngredient, Favorite, Follow, Ingredient, Recipe, Tag
+from .admin_tools import ScalableAdminMixin, autocomplete_filter
+from .images import pipeline
+from .models import (AmountIngredient, Follow, ImageStatus, Ingredient,
+                     Recipe, Tag)
 
 
 class AmountIngredientInline(admin.TabularInline):
@@ -12,33 +15,58 @@ class AmountIngredientInline(admin.TabularInline):
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(ImportExportModelAdmin):
+class IngredientAdmin(ScalableAdminMixin, ImportExportModelAdmin):
     list_display = ('name', 'measurement_unit')
     search_fields = ('name',)
-    list_filter = ('name',)
 
 
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('author', 'name', 'favorited')
+class RecipeAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('author', 'name', 'favorites_count', 'in_carts_count',
+                    'image_status')
+    list_select_related = ('author',)
     filter_horizontal = ('tags',)
-    list_filter = ('author', 'name', 'tags')
+    list_filter = (autocomplete_filter('author'), 'tags')
+    search_fields = ('name',)
+    autocomplete_fields = ('author',)
     inlines = (AmountIngredientInline,)
 
-    def favorited(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
-
-    favorited.short_description = 'В избранном'
+    def save_model(self, request, obj, form, change):
+        new_image = 'image' in form.changed_data
+        previous = None
+        if new_image:
+            if change:
+                previous = pipeline.replaced(
+                    Recipe.objects.only('image', 'image_variants').get(
+                        pk=obj.pk
+                    )
+                )
+            obj.image_status = ImageStatus.PENDING
+            obj.image_variants = []
+        super().save_model(request, obj, form, change)
+        if new_image:
+            pipeline.schedule(obj.id, previous)
 
 
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'slug')
 
 
-class AmountIngredientAdmin(admin.ModelAdmin):
+class AmountIngredientAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe', 'ingredient')
+    list_filter = (autocomplete_filter('recipe'),
+                   autocomplete_filter('ingredient'))
+    autocomplete_fields = ('recipe', 'ingredient')
+
+
+class FollowAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    list_filter = (autocomplete_filter('user'), autocomplete_filter('author'))
+    autocomplete_fields = ('user', 'author')
 
 
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(AmountIngredient, AmountIngredientAdmin)
-admin.site.register(Follow)
+admin.site.register(Follow, FollowAdmin)
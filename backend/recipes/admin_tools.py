@@ -0,0 +1,140 @@
+from django import forms
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+
+def estimate_count(model, using='default'):
+    """Число строк таблицы по статистике БД или None.
+    PostgreSQL хранит оценку в pg_class.reltuples, SQLite —
+    в sqlite_stat1 после выполнения ANALYZE.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass'
+        table = connection.ops.quote_name(table)
+    elif connection.vendor == 'sqlite':
+        sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1'
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (table,))
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None:
+        return None
+    estimate = int(float(str(row[0]).split()[0]))
+    # reltuples равен -1, если таблицу ещё не анализировали.
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор для больших таблиц.
+    Для списка без фильтров и поиска число строк берётся из статистики
+    БД, если оно больше `ADMIN_ESTIMATED_COUNT_THRESHOLD`, вместо
+    полного COUNT(*).
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not getattr(queryset, 'query', None) or queryset.query.where:
+            return super().count
+        estimate = estimate_count(queryset.model, queryset.db)
+        if (
+            estimate is not None
+            and estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD
+        ):
+            return estimate
+        return super().count
+
+
+class AutocompleteFilter(admin.ListFilter):
+    """Фильтр по внешнему ключу с полем автодополнения вместо
+    списка всех значений. Модель, на которую ссылается ключ,
+    должна быть зарегистрирована в админке с `search_fields`.
+    """
+    template = 'admin/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.field = model._meta.get_field(self.field_name)
+        self.title = self.field.verbose_name
+        self.parameter_name = f'{self.field_name}__id__exact'
+        self.admin_site = model_admin.admin_site
+        super().__init__(request, params, model, model_admin)
+        if self.parameter_name in params:
+            self.used_parameters[self.parameter_name] = params.pop(
+                self.parameter_name
+            )
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.parameter_name]
+
+    def value(self):
+        return self.used_parameters.get(self.parameter_name)
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            return queryset.filter(**self.used_parameters)
+        except (ValueError, ValidationError) as error:
+            raise IncorrectLookupParameters(error)
+
+    def choices(self, changelist):
+        form_field = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(self.field, self.admin_site),
+            required=False,
+        )
+        yield {
+            'selected': self.value() is not None,
+            'query_string': changelist.get_query_string(
+                remove=[self.parameter_name]
+            ),
+            'parameter_name': self.parameter_name,
+            'display': form_field.widget.render(
+                self.parameter_name, self.value(),
+                attrs={'id': f'autocomplete_filter_{self.field_name}'},
+            ),
+        }
+
+
+def autocomplete_filter(field_name):
+    return type(
+        f'{field_name.title()}AutocompleteFilter',
+        (AutocompleteFilter,),
+        {'field_name': field_name},
+    )
+
+
+class ScalableAdminMixin:
+    """Настройки списка объектов для больших таблиц:
+    оценка числа строк вместо COUNT(*) и подключение скриптов
+    фильтров с автодополнением.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        media = super().media
+        if any(
+            isinstance(list_filter, type)
+            and issubclass(list_filter, AutocompleteFilter)
+            for list_filter in self.list_filter
+        ):
+            media += AutocompleteSelect(None, self.admin_site).media
+        return media
@@ -0,0 +1,152 @@
+from array import array
+from bisect import bisect_left
+from itertools import islice
+
+TRIGRAM_SIZE = 3
+BIGRAM_SIZE = 2
+
+
+def normalize(value):
+    """Приведение строки к виду для сравнения без учёта регистра,
+    в том числе для кириллицы.
+    """
+    return ' '.join(value.casefold().split())
+
+
+def ngrams(value, size=TRIGRAM_SIZE):
+    return {
+        value[start:start + size]
+        for start in range(len(value) - size + 1)
+    }
+
+
+def index_grams(value):
+    """Триграммы и биграммы, по которым индексируется название."""
+    return ngrams(value) | ngrams(value, BIGRAM_SIZE)
+
+
+class IngredientIndex:
+    """Индекс для автодополнения названий ингредиентов.
+
+    Основной индекс — отсортированный массив нормализованных названий
+    с параллельным массивом id: совпадения по началу названия
+    находятся бинарным поиском. Вспомогательный индекс триграмм
+    (и биграмм для коротких запросов) отбирает кандидатов
+    для совпадений внутри названия.
+    Индекс не меняется после построения: `updated` возвращает копию
+    с применёнными изменениями, не пересобирая индекс целиком.
+    """
+
+    def __init__(self, items=()):
+        pairs = sorted((normalize(name), pk) for pk, name in items)
+        self.keys = [key for key, _ in pairs]
+        self.ids = array('q', (pk for _, pk in pairs))
+        self.names = {pk: key for key, pk in pairs}
+        self.postings = {}
+        for key, pk in pairs:
+            for gram in index_grams(key):
+                self.postings.setdefault(gram, set()).add(pk)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def updated(self, put=None, remove=()):
+        """Копия индекса, в которой удалены id из `remove`
+        и добавлены или переименованы пары id: название из `put`.
+        """
+        put = put or {}
+        index = self.__class__()
+        index.keys = list(self.keys)
+        index.ids = array('q', self.ids)
+        index.names = dict(self.names)
+        index.postings = dict(self.postings)
+        for pk in set(remove) | set(put):
+            index._discard(pk)
+        for pk, name in put.items():
+            index._add(pk, name)
+        return index
+
+    def _posting(self, gram):
+        # Изменяемые множества копируются, исходный индекс не меняется.
+        posting = set(self.postings.get(gram, ()))
+        self.postings[gram] = posting
+        return posting
+
+    def _discard(self, pk):
+        key = self.names.pop(pk, None)
+        if key is None:
+            return
+        position = bisect_left(self.keys, key)
+        while self.ids[position] != pk:
+            position += 1
+        del self.keys[position]
+        del self.ids[position]
+        for gram in index_grams(key):
+            posting = self._posting(gram)
+            posting.discard(pk)
+            if not posting:
+                del self.postings[gram]
+
+    def _add(self, pk, name):
+        key = normalize(name)
+        position = bisect_left(self.keys, key)
+        while position < len(self.keys) and (
+            self.keys[position] == key and self.ids[position] < pk
+        ):
+            position += 1
+        self.keys.insert(position, key)
+        self.ids.insert(position, pk)
+        self.names[pk] = key
+        for gram in index_grams(key):
+            self._posting(gram).add(pk)
+
+    def prefix_matches(self, query):
+        position = bisect_left(self.keys, query)
+        while position < len(self.keys) and (
+            self.keys[position].startswith(query)
+        ):
+            yield self.ids[position]
+            position += 1
+
+    def contains_matches(self, query):
+        """Названия, содержащие строку не с начала, по возрастанию
+        позиции вхождения, затем по алфавиту.
+        """
+        if len(query) >= TRIGRAM_SIZE:
+            postings = sorted(
+                (self.postings.get(gram, set()) for gram in ngrams(query)),
+                key=len
+            )
+            candidates = set.intersection(*postings)
+        elif len(query) == BIGRAM_SIZE:
+            candidates = self.postings.get(query, ())
+        else:
+            candidates = self.names
+        matches = []
+        for pk in candidates:
+            key = self.names[pk]
+            position = key.find(query)
+            if position > 0:
+                matches.append((position, key, pk))
+        matches.sort()
+        for _, _, pk in matches:
+            yield pk
+
+    def search(self, query, limit=None, predicate=None):
+        """id ингредиентов по запросу: сначала совпадения по началу
+        названия, затем вхождения внутри названия.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        found = (
+            pk for matches in (self.prefix_matches(query),
+                               self.contains_matches(query))
+            for pk in matches
+        )
+        if predicate is not None:
+            found = filter(predicate, found)
+        return list(islice(found, limit))
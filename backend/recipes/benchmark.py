@@ -0,0 +1,496 @@
+"""Генератор данных и замеры эндпоинтов API для сравнения
+производительности между коммитами.
+"""
+import math
+import random
+import time
+from base64 import b64encode
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from . import cache, counters, feed, search, totals
+from .models import (AmountIngredient, Favorite, Follow, Ingredient, Recipe,
+                     ShoppingList, Tag)
+
+User = get_user_model()
+
+USERNAME_PREFIX = 'bench'
+PASSWORD = 'benchmark-password'
+BATCH_SIZE = 1000
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#D2759E', 'dessert'),
+    ('Выпечка', '#C49A6C', 'bakery'),
+    ('Суп', '#2D9CDB', 'soup'),
+    ('Салат', '#6FCF97', 'salad'),
+    ('Напиток', '#F2C94C', 'drink'),
+)
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+WORDS = (
+    'домашний', 'быстрый', 'пряный', 'сливочный', 'томатный', 'овощной',
+    'куриный', 'грибной', 'сырный', 'лимонный', 'острый', 'летний',
+    'зимний', 'постный', 'праздничный', 'деревенский',
+)
+DISHES = (
+    'суп', 'салат', 'пирог', 'рагу', 'плов', 'омлет', 'паста', 'каша',
+    'запеканка', 'соус', 'борщ', 'кекс', 'смузи', 'гратен', 'ризотто',
+)
+
+
+def zipf_weights(count, exponent=1.1):
+    """Веса популярности: несколько элементов встречаются часто,
+    большинство редко.
+    """
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def sample(rng, population, weights, count):
+    """`count` разных элементов с учётом весов."""
+    count = min(count, len(population))
+    chosen = {}
+    while len(chosen) < count:
+        for item in rng.choices(population, weights, k=count):
+            chosen.setdefault(item, None)
+            if len(chosen) == count:
+                break
+    return list(chosen)
+
+
+def skewed(rng, mean, limit):
+    """Целое с экспоненциальным распределением и средним `mean`."""
+    if mean <= 0:
+        return 0
+    return min(int(rng.expovariate(1 / mean)), limit)
+
+
+def seed(users=100, recipes_per_user=3, favorites_per_user=10,
+         carts_per_user=3, follows_per_user=5, ingredients=500,
+         random_seed=1):
+    """Заполняет БД данными для замеров.
+    При одинаковых параметрах и пустой БД данные совпадают вплоть
+    до id. Строки вставляются пачками через bulk_create, поэтому
+    сигналы не срабатывают: счётчики, маски тегов, поисковый индекс
+    и версии кэша обновляются в конце одним проходом.
+    Возвращает число созданных объектов каждой модели.
+    """
+    rng = random.Random(random_seed)
+    created = {}
+    with transaction.atomic():
+        tags = seed_tags()
+        ingredient_ids = seed_ingredients(rng, ingredients)
+        authors = seed_users(users)
+        created['users'] = len(authors)
+
+        recipe_rows = []
+        for author_id in authors:
+            for _ in range(skewed(rng, recipes_per_user,
+                                  recipes_per_user * 10)):
+                recipe_rows.append(author_id)
+        recipes = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=author_id,
+                    name=f'{rng.choice(WORDS).capitalize()} '
+                         f'{rng.choice(DISHES)}',
+                    text=' '.join(rng.choices(WORDS + DISHES, k=30)),
+                    image='recipes/benchmark.jpg',
+                    cooking_time=max(
+                        1, int(rng.lognormvariate(3.3, 0.6))
+                    ),
+                ) for author_id in recipe_rows
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        recipe_ids = inserted_ids(recipes, Recipe.objects.filter(
+            author__username__startswith=USERNAME_PREFIX
+        ))
+        created['recipes'] = len(recipe_ids)
+
+        ingredient_weights = zipf_weights(len(ingredient_ids))
+        tag_weights = zipf_weights(len(tags), 0.7)
+        Through = Recipe.tags.through
+        created['amounts'] = bulk_insert(AmountIngredient, (
+            AmountIngredient(recipe_id=recipe_id, ingredient_id=pk,
+                             amount=rng.randint(1, 50) * 10)
+            for recipe_id in recipe_ids
+            for pk in sample(rng, ingredient_ids, ingredient_weights,
+                             rng.randint(3, 12))
+        ))
+        created['recipe_tags'] = bulk_insert(Through, (
+            Through(recipe_id=recipe_id, tag_id=tag.id)
+            for recipe_id in recipe_ids
+            for tag in sample(rng, tags, tag_weights, rng.randint(1, 3))
+        ))
+
+        # Популярность рецептов и авторов не зависит от порядка создания.
+        popular_recipes = rng.sample(recipe_ids, len(recipe_ids))
+        recipe_weights = zipf_weights(len(popular_recipes))
+        popular_authors = rng.sample(authors, len(authors))
+        author_weights = zipf_weights(len(popular_authors))
+        for model, mean in ((Favorite, favorites_per_user),
+                            (ShoppingList, carts_per_user)):
+            created[model._meta.model_name] = bulk_insert(model, (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in authors
+                for recipe_id in sample(
+                    rng, popular_recipes, recipe_weights,
+                    skewed(rng, mean, mean * 10)
+                )
+            ))
+        created['follow'] = bulk_insert(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in authors
+            for author_id in sample(
+                rng, popular_authors, author_weights,
+                skewed(rng, follows_per_user, follows_per_user * 10)
+            )
+            if author_id != user_id
+        ))
+
+        Recipe.objects.filter(id__in=recipe_ids).update_tags_mask()
+        counters.recount()
+        totals.rebuild()
+        feed.rebuild_all()
+        search.rebuild()
+    for name in ('tags', 'ingredients', 'users', 'recipes'):
+        cache.bump_version(name)
+    return created
+
+
+def seed_tags():
+    tags = {tag.slug: tag for tag in Tag.objects.filter(
+        slug__in=[slug for _, _, slug in TAGS]
+    )}
+    for name, color, slug in TAGS:
+        if slug not in tags:
+            tags[slug] = Tag.objects.create(name=name, color=color, slug=slug)
+    return [tags[slug] for _, _, slug in TAGS]
+
+
+def seed_ingredients(rng, count):
+    Ingredient.objects.bulk_create(
+        (
+            Ingredient(name=f'Продукт {number:05d}',
+                       measurement_unit=rng.choice(UNITS))
+            for number in range(count)
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return list(Ingredient.objects.filter(
+        name__startswith='Продукт '
+    ).order_by('name').values_list('id', flat=True)[:count])
+
+
+def seed_users(count):
+    password = make_password(PASSWORD)
+    users = User.objects.bulk_create(
+        (
+            User(username=f'{USERNAME_PREFIX}{number:06d}',
+                 email=f'{USERNAME_PREFIX}{number:06d}@example.org',
+                 first_name='Тест', last_name=f'Пользователь {number}',
+                 password=password)
+            for number in range(count)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    return inserted_ids(users, User.objects.filter(
+        username__startswith=USERNAME_PREFIX
+    ))
+
+
+def inserted_ids(objects, queryset):
+    """id объектов после bulk_create. SQLite в Django 3.2 их
+    не возвращает, тогда они читаются из `queryset` в порядке вставки.
+    """
+    if objects and objects[0].pk is None:
+        return list(queryset.order_by('id').values_list('id', flat=True))
+    return [obj.pk for obj in objects]
+
+
+def bulk_insert(model, objects):
+    objects = list(objects)
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    return len(objects)
+
+
+def png_image(size=(600, 400)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + b64encode(buffer.getvalue()).decode()
+
+
+class Endpoint:
+    """Замеряемый запрос.
+    `path` и `data` — строки формата или функции от контекста.
+    `setup` выполняется перед каждым замером, `teardown` — после,
+    оба получают клиент, контекст и (для `teardown`) ответ.
+    """
+
+    def __init__(self, name, method, path, data=None, setup=None,
+                 teardown=None, anonymous=False):
+        self.name = name
+        self.anonymous = anonymous
+        self.method = method
+        self.path = path
+        self.data = data
+        self.setup = setup
+        self.teardown = teardown
+
+    def resolve(self, value, context):
+        if callable(value):
+            return value(context)
+        if isinstance(value, str):
+            return value.format(**context)
+        return value
+
+
+def recipe_payload(context):
+    return {
+        'ingredients': [{'id': pk, 'amount': 100}
+                        for pk in context['ingredient_ids']],
+        'tags': context['tag_ids'],
+        'image': context['image'],
+        'name': 'Замер',
+        'text': 'Рецепт для замера',
+        'cooking_time': 30,
+    }
+
+
+def create_recipe(client, context):
+    response = client.post('/api/recipes/', recipe_payload(context),
+                           format='json')
+    context['new_recipe'] = response.data['id']
+
+
+def delete_created_recipe(client, context, response):
+    Recipe.objects.filter(id=response.data['id']).delete()
+
+
+def post(path):
+    def setup(client, context):
+        client.post(path.format(**context))
+    return setup
+
+
+def delete(path):
+    def teardown(client, context, response):
+        client.delete(path.format(**context))
+    return teardown
+
+
+def login(client, context):
+    response = client.post('/api/auth/token/login/', {
+        'email': context['reader_email'], 'password': PASSWORD,
+    })
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Token {response.data["auth_token"]}'
+    )
+
+
+def logout(client, context, response):
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Token {response.data["auth_token"]}'
+    )
+    client.post('/api/auth/token/logout/')
+    client.credentials()
+
+
+def forget_token(client, context, response):
+    client.credentials()
+
+
+def reset_password(client, context, response):
+    # Пароль меняется у того же объекта, под которым выполняются
+    # запросы, иначе следующая проверка текущего пароля не пройдёт.
+    user = context['reader_user']
+    user.set_password(PASSWORD)
+    user.save(update_fields=('password',))
+
+
+def delete_new_user(client, context, response):
+    User.objects.filter(email='bench-new@example.org').delete()
+
+
+ENDPOINTS = (
+    Endpoint('api-root', 'get', '/api/'),
+    Endpoint('recipes-list', 'get', '/api/recipes/'),
+    Endpoint('recipes-list-anonymous', 'get', '/api/recipes/?page=2',
+             anonymous=True),
+    Endpoint('recipes-list-tags', 'get', '/api/recipes/?tags={tag_slug}'),
+    Endpoint('recipes-list-search', 'get',
+             '/api/recipes/?search={search_word}'),
+    Endpoint('recipes-list-favorited', 'get',
+             '/api/recipes/?is_favorited=1'),
+    Endpoint('recipes-list-author', 'get', '/api/recipes/?author={author}'),
+    Endpoint('recipes-feed', 'get', '/api/recipes/feed/'),
+    Endpoint('recipes-detail', 'get', '/api/recipes/{recipe}/'),
+    Endpoint('recipes-create', 'post', '/api/recipes/', recipe_payload,
+             teardown=delete_created_recipe),
+    Endpoint('recipes-update', 'patch', '/api/recipes/{own_recipe}/',
+             recipe_payload),
+    Endpoint('recipes-delete', 'delete', '/api/recipes/{new_recipe}/',
+             setup=create_recipe),
+    Endpoint('recipes-favorite-add', 'post',
+             '/api/recipes/{recipe}/favorite/',
+             teardown=delete('/api/recipes/{recipe}/favorite/')),
+    Endpoint('recipes-favorite-remove', 'delete',
+             '/api/recipes/{recipe}/favorite/',
+             setup=post('/api/recipes/{recipe}/favorite/')),
+    Endpoint('recipes-shopping-cart-add', 'post',
+             '/api/recipes/{recipe}/shopping_cart/',
+             teardown=delete('/api/recipes/{recipe}/shopping_cart/')),
+    Endpoint('recipes-shopping-cart-remove', 'delete',
+             '/api/recipes/{recipe}/shopping_cart/',
+             setup=post('/api/recipes/{recipe}/shopping_cart/')),
+    Endpoint('recipes-download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/'),
+    Endpoint('tags-list', 'get', '/api/tags/'),
+    Endpoint('tags-detail', 'get', '/api/tags/{tag}/'),
+    Endpoint('ingredients-list', 'get', '/api/ingredients/'),
+    Endpoint('ingredients-search', 'get',
+             '/api/ingredients/?name={ingredient_prefix}'),
+    Endpoint('ingredients-detail', 'get', '/api/ingredients/{ingredient}/'),
+    Endpoint('users-list', 'get', '/api/users/'),
+    Endpoint('users-detail', 'get', '/api/users/{author}/'),
+    Endpoint('users-me', 'get', '/api/users/me/'),
+    Endpoint('users-subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3'),
+    Endpoint('users-subscribe', 'post', '/api/users/{stranger}/subscribe/',
+             teardown=delete('/api/users/{stranger}/subscribe/')),
+    Endpoint('users-unsubscribe', 'delete',
+             '/api/users/{stranger}/subscribe/',
+             setup=post('/api/users/{stranger}/subscribe/')),
+    Endpoint('users-create', 'post', '/api/users/', {
+        'email': 'bench-new@example.org', 'username': 'bench-new',
+        'first_name': 'Новый', 'last_name': 'Пользователь',
+        'password': 'Bench-Password-2',
+    }, teardown=delete_new_user),
+    Endpoint('users-set-password', 'post', '/api/users/set_password/', {
+        'current_password': PASSWORD, 'new_password': 'Bench-Password-2',
+    }, teardown=reset_password),
+    Endpoint('auth-token-login', 'post', '/api/auth/token/login/',
+             lambda context: {'email': context['reader_email'],
+                              'password': PASSWORD},
+             teardown=logout, anonymous=True),
+    Endpoint('auth-token-logout', 'post', '/api/auth/token/logout/',
+             setup=login, teardown=forget_token, anonymous=True),
+)
+
+
+def build_context():
+    """Id объектов, на которых выполняются запросы: самый активный
+    пользователь читает чужой популярный рецепт.
+    """
+    reader = User.objects.filter(
+        username__startswith=USERNAME_PREFIX
+    ).order_by('-recipes_count', 'id').first()
+    if reader is None or not reader.recipes_count:
+        raise ValueError(
+            'Нет данных для замеров, выполните seed_benchmark_data.'
+        )
+    author = User.objects.exclude(id=reader.id).order_by(
+        '-followers_count', 'id'
+    ).first()
+    following = Follow.objects.filter(user=reader).values('author')
+    stranger = User.objects.exclude(id__in=following).exclude(
+        id__in=(reader.id, author.id)
+    ).order_by('id').first()
+    recipe = Recipe.objects.exclude(author=reader).exclude(
+        id__in=Favorite.objects.filter(user=reader).values('recipe')
+    ).exclude(
+        id__in=ShoppingList.objects.filter(user=reader).values('recipe')
+    ).order_by('-favorites_count', 'id').first()
+    tag = Tag.objects.order_by('bit').first()
+    ingredients = list(Ingredient.objects.order_by('id')[:5])
+    return {
+        'reader': reader.id,
+        'reader_email': reader.email,
+        'author': author.id,
+        'stranger': stranger.id,
+        'recipe': recipe.id,
+        'own_recipe': Recipe.objects.filter(author=reader).first().id,
+        'tag': tag.id,
+        'tag_slug': tag.slug,
+        'tag_ids': [tag.id],
+        'ingredient': ingredients[0].id,
+        'ingredient_ids': [item.id for item in ingredients],
+        'ingredient_prefix': ingredients[0].name[:3],
+        'search_word': recipe.name.split()[-1],
+        'image': png_image(),
+    }
+
+
+def percentile(values, fraction):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def measure(client, endpoint, context, iterations, warmup=1):
+    """Время ответа (мс) и число запросов к БД для `endpoint`.
+    Первые `warmup` запросов не учитываются: они заполняют кэши.
+    """
+    timings, queries = [], []
+    status = None
+    for number in range(warmup + iterations):
+        if endpoint.setup:
+            endpoint.setup(client, context)
+        path = endpoint.resolve(endpoint.path, context)
+        data = endpoint.resolve(endpoint.data, context)
+        # Журнал запросов ограничен по длине, при переполнении
+        # CaptureQueriesContext насчитал бы ноль.
+        reset_queries()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, endpoint.method)(
+                path, data, format='json'
+            )
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        status = response.status_code
+        if endpoint.teardown:
+            endpoint.teardown(client, context, response)
+        if number >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+    return {
+        'method': endpoint.method.upper(),
+        'path': endpoint.resolve(endpoint.path, context),
+        'status': status,
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p90_ms': round(percentile(timings, 0.9), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': max(queries),
+    }
+
+
+def run(iterations=20, endpoints=ENDPOINTS, names=None):
+    """Замеры всех эндпоинтов на данных, созданных `seed`."""
+    context = build_context()
+    client = APIClient()
+    reader = context['reader_user'] = User.objects.get(
+        id=context['reader']
+    )
+    results = {}
+    for endpoint in endpoints:
+        if names and endpoint.name not in names:
+            continue
+        client.force_authenticate(None if endpoint.anonymous else reader)
+        results[endpoint.name] = measure(client, endpoint, context,
+                                         iterations)
+    return results
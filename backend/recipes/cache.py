@@ -0,0 +1,264 @@
+import threading
+import time
+from array import array
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .autocomplete import IngredientIndex
+from .models import Ingredient, Tag
+
+VERSION_KEY = 'foodgram:version:{}'
+MODIFIED_KEY = 'foodgram:modified:{}'
+
+
+def get_version(name):
+    """Текущая версия набора данных `name` из общего кэша.
+    Начальное значение случайное, чтобы после очистки кэша версия
+    не совпала с уже загруженной в каком-либо процессе.
+    """
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().int >> 80, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    cache.set(MODIFIED_KEY.format(name), time.time(), timeout=None)
+    key = VERSION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return get_version(name)
+
+
+def invalidate(name):
+    """Сбрасывает версию после фиксации транзакции."""
+    transaction.on_commit(lambda: bump_version(name))
+
+
+def get_state(names):
+    """Версии наборов данных `names` и время последнего изменения
+    любого из них (timestamp) за одно обращение к кэшу.
+    Если время изменения неизвестно, им считается текущее время.
+    """
+    keys = [VERSION_KEY.format(name) for name in names]
+    modified_keys = [MODIFIED_KEY.format(name) for name in names]
+    values = cache.get_many(keys + modified_keys)
+    versions = [
+        values[key] if key in values else get_version(name)
+        for key, name in zip(keys, names)
+    ]
+    modified = []
+    for key in modified_keys:
+        if key not in values:
+            cache.add(key, time.time(), timeout=None)
+            values[key] = cache.get(key)
+        modified.append(values[key])
+    return versions, max(modified)
+
+
+def recipe_version(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def user_version(user_id):
+    """Версия данных, которые видит только этот пользователь:
+    избранное, список покупок и подписки.
+    """
+    return f'user:{user_id}'
+
+
+def invalidate_recipe(recipe_id):
+    invalidate('recipes')
+    invalidate(recipe_version(recipe_id))
+
+
+class ReferenceCache:
+    """Справочник, который хранится в памяти процесса
+    и перечитывается из БД при смене версии в общем кэше.
+    """
+    name = None
+
+    def __init__(self):
+        self.version = None
+        self.data = None
+        # Изменения, зафиксированные после загрузки данных и ещё
+        # не применённые к ним.
+        self.changes = []
+        self.lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        # Кэш общий для процесса, поля сериализаторов его не копируют.
+        return self
+
+    def load(self):
+        raise NotImplementedError
+
+    def apply(self, data, changes):
+        """Копия данных со всеми изменениями `changes` по порядку."""
+        raise NotImplementedError
+
+    def get(self):
+        version = get_version(self.name)
+        if self.data is None or self.version != version or self.changes:
+            with self.lock:
+                if self.data is None or self.version != version:
+                    self.data = self.load()
+                    self.version = version
+                    self.changes = []
+                elif self.changes:
+                    self.data = self.apply(self.data, self.changes)
+                    self.changes = []
+        return self.data
+
+    def invalidate(self, change=None):
+        """Сбрасывает версию справочника после фиксации транзакции.
+        Если после загрузки справочник никто больше не менял,
+        процесс запоминает изменение `change` и применяет его у себя
+        без чтения из БД при следующем обращении, одной копией
+        для всех накопленных изменений.
+        """
+        transaction.on_commit(lambda: self.commit(change))
+
+    def commit(self, change=None):
+        with self.lock:
+            current = get_version(self.name)
+            version = bump_version(self.name)
+            if (
+                change is not None
+                and self.data is not None
+                and self.version == current
+                and version == current + 1
+            ):
+                self.changes.append(change)
+                self.version = version
+
+
+class Catalog:
+    """Компактное представление справочника: значения полей
+    хранятся кортежами в словаре по id, порядок выдачи — списком id.
+    """
+    model = None
+    fields = ()
+    # Сколько первых полей отдаётся через API.
+    public_fields = None
+
+    def __init__(self, rows):
+        self.rows = {row[0]: row[1:] for row in rows}
+        self.order = array('q', self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, pk):
+        return pk in self.rows
+
+    def as_dict(self, pk):
+        return dict(zip(self.fields[:self.public_fields],
+                        (pk,) + self.rows[pk]))
+
+    def as_list(self, ids=None):
+        return [self.as_dict(pk) for pk in (self.order if ids is None
+                                            else ids)]
+
+    def get(self, pk):
+        """Экземпляр модели с id `pk` или None, без запроса к БД."""
+        values = self.rows.get(pk)
+        if values is None:
+            return None
+        return self.model.from_db(
+            self.model.objects.db, self.fields, (pk,) + values
+        )
+
+
+class TagCatalog(Catalog):
+    model = Tag
+    fields = ('id', 'name', 'color', 'slug', 'bit')
+    public_fields = 4
+
+    def masks(self, slugs):
+        """Маски тегов с указанными слагами."""
+        slugs = set(slugs)
+        return [
+            1 << values[3] for values in self.rows.values()
+            if values[2] in slugs
+        ]
+
+    def slugs(self):
+        return sorted({values[2] for values in self.rows.values()})
+
+
+class IngredientCatalog(Catalog):
+    """Каталог ингредиентов с индексом автодополнения.
+    Порядок выдачи совпадает с порядком индекса.
+    """
+    model = Ingredient
+    fields = ('id', 'name', 'measurement_unit')
+
+    def __init__(self, rows, index=None):
+        self.rows = {row[0]: row[1:] for row in rows}
+        if index is None:
+            index = IngredientIndex(
+                (pk, name) for pk, (name, _) in self.rows.items()
+            )
+        self.index = self.order = index
+
+    def updated(self, put=None, remove=()):
+        """Копия каталога с добавленными или изменёнными строками `put`
+        и удалёнными id из `remove`; индекс обновляется частично.
+        """
+        put = put or {}
+        rows = dict(self.rows)
+        for pk in remove:
+            rows.pop(pk, None)
+        rows.update(put)
+        return self.__class__(
+            ((pk,) + values for pk, values in rows.items()),
+            index=self.index.updated(
+                {pk: values[0] for pk, values in put.items()}, remove
+            ),
+        )
+
+    def search(self, name, measurement_unit=None, limit=None):
+        def same_unit(pk):
+            return self.rows[pk][1] == measurement_unit
+
+        return self.index.search(name, limit,
+                                 same_unit if measurement_unit else None)
+
+
+class TagCache(ReferenceCache):
+    name = 'tags'
+
+    def load(self):
+        return TagCatalog(Tag.objects.values_list(*TagCatalog.fields))
+
+
+class IngredientCache(ReferenceCache):
+    """Изменения — пары из словаря добавленных или изменённых
+    строк и id удалённых.
+    """
+    name = 'ingredients'
+
+    def load(self):
+        return IngredientCatalog(
+            Ingredient.objects.values_list(*IngredientCatalog.fields)
+        )
+
+    def apply(self, data, changes):
+        put, remove = {}, set()
+        for changed, removed in changes:
+            for pk in removed:
+                put.pop(pk, None)
+            remove.update(removed)
+            remove.difference_update(changed)
+            put.update(changed)
+        return data.updated(put=put, remove=remove)
+
+
+tags = TagCache()
+ingredients = IngredientCache()
@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Follow, Recipe, ShoppingList
+
+User = get_user_model()
+
+# Модель со счётчиком, поле счётчика, считаемая модель и её внешний
+# ключ на модель со счётчиком.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+    (User, 'following_count', Follow, 'user'),
+)
+
+
+def change(model, pk, field, delta):
+    """Атомарно меняет счётчик на `delta` выражением F().
+    Счётчик не уходит ниже нуля, даже если разошёлся с данными.
+    """
+    if pk is None:
+        return
+    counters = model.objects.filter(pk=pk)
+    if delta < 0:
+        counters = counters.filter(**{f'{field}__gte': -delta})
+    counters.update(**{field: F(field) + delta})
+
+
+def actual(source, foreign_key):
+    """Подзапрос с настоящим значением счётчика."""
+    return Coalesce(Subquery(
+        source.objects.filter(
+            **{foreign_key: OuterRef('pk')}
+        ).order_by().values(foreign_key).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def recount():
+    """Исправляет разошедшиеся счётчики.
+    Возвращает число исправленных строк по каждому счётчику.
+    """
+    fixed = {}
+    for model, field, source, foreign_key in COUNTERS:
+        value = actual(source, foreign_key)
+        fixed[f'{model._meta.model_name}.{field}'] = model.objects.filter(
+            ~Q(**{field: value})
+        ).update(**{field: value})
+    return fixed
@@ -0,0 +1,229 @@
+import logging
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import invalidate_recipe
+from .models import ImageStatus, Recipe
+
+logger = logging.getLogger(__name__)
+
+JPEG_QUALITY = 85
+VARIANT_QUALITY = 80
+# Формат в ответе API, расширение файла и формат Pillow.
+VARIANT_FORMATS = (
+    ('webp', 'webp', 'WEBP'),
+    ('jpeg', 'jpg', 'JPEG'),
+)
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+
+
+def flatten(image):
+    """Картинка без прозрачности, на белом фоне."""
+    if not has_alpha(image):
+        return image.convert('RGB')
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def render_image(file):
+    """Декодирует картинку, поворачивает по EXIF, уменьшает до
+    `RECIPE_IMAGE_MAX_DIMENSION` и кодирует заново без метаданных.
+    Возвращает картинку, содержимое файла и расширение.
+    """
+    image = Image.open(file)
+    image = ImageOps.exif_transpose(image)
+    size = settings.RECIPE_IMAGE_MAX_DIMENSION
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    if has_alpha(image):
+        image = image.convert('RGBA')
+        image.save(buffer, 'PNG', optimize=True)
+        return image, buffer.getvalue(), 'png'
+    image = image.convert('RGB')
+    image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True,
+               progressive=True)
+    return image, buffer.getvalue(), 'jpg'
+
+
+def variant_name(name, width, extension):
+    """Путь уменьшенной копии: recipes/<имя>.jpg ->
+    recipes/variants/<имя>/<ширина>.<расширение>.
+    Имя картинки уникально для каждой загрузки, поэтому файлы копий
+    не меняются и могут кэшироваться бессрочно.
+    """
+    return posixpath.join(variants_directory(name), f'{width}.{extension}')
+
+
+def variants_directory(name):
+    directory, filename = posixpath.split(name)
+    return posixpath.join(
+        directory, 'variants', posixpath.splitext(filename)[0]
+    )
+
+
+def save_variants(storage, name, image):
+    """Сохраняет уменьшенные копии картинки `name` в WebP и JPEG
+    для ширин из `RECIPE_IMAGE_VARIANT_WIDTHS`, меньших ширины
+    картинки. Возвращает список сохранённых ширин.
+    """
+    image = flatten(image)
+    widths = sorted(
+        width for width in settings.RECIPE_IMAGE_VARIANT_WIDTHS
+        if width < image.width
+    )
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        variant = image.resize((width, height), Image.Resampling.LANCZOS)
+        for _, extension, pillow_format in VARIANT_FORMATS:
+            buffer = BytesIO()
+            variant.save(buffer, pillow_format, quality=VARIANT_QUALITY)
+            path = variant_name(name, width, extension)
+            storage.delete(path)
+            storage.save(path, ContentFile(buffer.getvalue()))
+    return widths
+
+
+def delete_variants(storage, name, widths):
+    for width in widths:
+        for _, extension, _ in VARIANT_FORMATS:
+            storage.delete(variant_name(name, width, extension))
+
+
+def delete_image(storage, name, widths):
+    """Удаляет заменённую картинку, её уменьшенные копии
+    и опустевший каталог копий, если хранилище локальное.
+    """
+    delete_variants(storage, name, widths)
+    storage.delete(name)
+    try:
+        os.rmdir(storage.path(variants_directory(name)))
+    except (NotImplementedError, OSError):
+        pass
+
+
+def process_recipe_image(recipe_id, previous=None):
+    """Обрабатывает загруженную картинку рецепта и переводит
+    рецепт в статус `ready` или `failed`.
+    Если за время обработки картинку заменили, результат отбрасывается.
+    `previous` — имя и ширины копий картинки, которую заменила
+    загруженная: её файлы удаляются после обработки.
+    """
+    try:
+        process_image(recipe_id)
+    finally:
+        if previous is not None:
+            delete_image(Recipe.image.field.storage, *previous)
+
+
+def process_image(recipe_id):
+    recipe = Recipe.objects.filter(
+        id=recipe_id, image_status=ImageStatus.PENDING
+    ).only('id', 'image').first()
+    if recipe is None:
+        return
+    source = recipe.image.name
+    storage = recipe.image.storage
+    recipes = Recipe.objects.filter(id=recipe_id, image=source)
+    try:
+        with storage.open(source, 'rb') as file:
+            image, content, extension = render_image(file)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning('Не удалось обработать картинку рецепта %s',
+                       recipe_id, exc_info=True)
+        recipes.update(image_status=ImageStatus.FAILED)
+        return
+    name = storage.save(
+        recipe.image.field.generate_filename(
+            recipe, f'{uuid4()}.{extension}'
+        ),
+        ContentFile(content)
+    )
+    widths = save_variants(storage, name, image)
+    if recipes.update(image=name, image_variants=widths,
+                      image_status=ImageStatus.READY,
+                      updated_at=timezone.now()):
+        invalidate_recipe(recipe_id)
+        storage.delete(source)
+    else:
+        delete_variants(storage, name, widths)
+        storage.delete(name)
+
+
+class ImagePipeline:
+    """Пул потоков для обработки картинок вне запроса.
+    Очередь ограничена `RECIPE_IMAGE_QUEUE_SIZE`: если она заполнена,
+    рецепт остаётся в статусе `pending` до запуска
+    `manage.py process_recipe_images`.
+    """
+
+    def __init__(self):
+        self.executor = None
+        self.slots = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.executor is None:
+                self.slots = threading.BoundedSemaphore(
+                    settings.RECIPE_IMAGE_QUEUE_SIZE
+                )
+                self.executor = ThreadPoolExecutor(
+                    max_workers=settings.RECIPE_IMAGE_WORKERS,
+                    thread_name_prefix='recipe-image',
+                )
+
+    @staticmethod
+    def replaced(recipe):
+        """Имя и ширины копий текущей картинки рецепта перед её
+        заменой, для `schedule`.
+        """
+        if not recipe.image:
+            return None
+        return recipe.image.name, list(recipe.image_variants)
+
+    def schedule(self, recipe_id, previous=None):
+        """Ставит обработку в очередь после фиксации транзакции."""
+        transaction.on_commit(lambda: self.submit(recipe_id, previous))
+
+    def submit(self, recipe_id, previous=None):
+        if settings.RECIPE_IMAGE_SYNC:
+            process_recipe_image(recipe_id, previous)
+            return True
+        self.start()
+        if not self.slots.acquire(blocking=False):
+            logger.warning('Очередь обработки картинок заполнена, '
+                           'рецепт %s остаётся в ожидании', recipe_id)
+            # Рецепт уже ссылается на новую картинку.
+            if previous is not None:
+                delete_image(Recipe.image.field.storage, *previous)
+            return False
+        self.executor.submit(self.run, recipe_id, previous)
+        return True
+
+    def run(self, recipe_id, previous=None):
+        try:
+            process_recipe_image(recipe_id, previous)
+        except Exception:
+            logger.exception('Ошибка обработки картинки рецепта %s',
+                             recipe_id)
+        finally:
+            self.slots.release()
+            connection.close()
+
+
+pipeline = ImagePipeline()
@@ -0,0 +1,174 @@
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.test.utils import (override_settings, setup_databases,
+                               teardown_databases)
+from recipes import benchmark
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа (перцентили) и число запросов к БД '
+            'для эндпоинтов API на данных нескольких размеров. '
+            'Замеры идут во временной БД, рабочие данные не меняются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=(100, 1000),
+            help='Количество пользователей для каждого прогона.'
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=20,
+            help='Количество замеров каждого эндпоинта.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=1,
+            help='Начальное значение генератора данных.'
+        )
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            choices=[endpoint.name for endpoint in benchmark.ENDPOINTS],
+            help='Замерить только этот эндпоинт (можно повторять).'
+        )
+        parser.add_argument(
+            '--output', default='benchmark.json',
+            help='Файл для результатов в JSON.'
+        )
+        parser.add_argument(
+            '--compare',
+            help='Файл с прошлыми результатами для сравнения.'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=20,
+            help='Рост медианы в процентах, который считается регрессией.'
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должен быть больше нуля.')
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as file:
+                    previous = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Не удалось прочитать результаты: '
+                                   f'{error}')
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'created': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'seed': options['seed'],
+            },
+            'results': {},
+        }
+        old_config = setup_databases(verbosity=0, interactive=False,
+                                     aliases={'default'})
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(
+                        CACHES={
+                            alias: {
+                                'BACKEND': 'django.core.cache.backends.'
+                                           'locmem.LocMemCache',
+                                'LOCATION': f'benchmark-{alias}',
+                            } for alias in settings.CACHES
+                        },
+                        MEDIA_ROOT=media_root,
+                        RECIPE_IMAGE_SYNC=True,
+                    ):
+                for size in options['sizes']:
+                    report['results'][str(size)] = self.run_size(
+                        size, options
+                    )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2,
+                      sort_keys=True)
+            file.write('\n')
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}.'
+        ))
+        if previous is not None:
+            self.compare(previous, report, options['threshold'])
+
+    def run_size(self, size, options):
+        call_command('flush', interactive=False, verbosity=0)
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        started = time.monotonic()
+        data = benchmark.seed(users=size, random_seed=options['seed'])
+        self.stdout.write(
+            f'Пользователей: {size}, данные созданы за '
+            f'{time.monotonic() - started:.1f} с: '
+            + ', '.join(f'{name} {count}' for name, count in data.items())
+        )
+        endpoints = benchmark.run(options['iterations'],
+                                  names=options['endpoints'])
+        for name, result in endpoints.items():
+            self.stdout.write(
+                f'  {name:<32} {result["status"]:>3} '
+                f'p50 {result["p50_ms"]:>8.2f} мс  '
+                f'p90 {result["p90_ms"]:>8.2f} мс  '
+                f'p99 {result["p99_ms"]:>8.2f} мс  '
+                f'запросов {result["queries"]}'
+            )
+        return {'data': data, 'endpoints': endpoints}
+
+    def compare(self, previous, report, threshold):
+        commit = previous.get('meta', {}).get('commit')
+        self.stdout.write(f'Сравнение с {commit or "прошлым прогоном"}:')
+        regressions = 0
+        for size, current in report['results'].items():
+            old = previous.get('results', {}).get(size)
+            if old is None:
+                continue
+            for name, result in current['endpoints'].items():
+                before = old['endpoints'].get(name)
+                if before is None:
+                    continue
+                change = (
+                    (result['p50_ms'] - before['p50_ms'])
+                    / before['p50_ms'] * 100 if before['p50_ms'] else 0
+                )
+                line = (
+                    f'  {size:>6} {name:<32} '
+                    f'p50 {before["p50_ms"]:.2f} → {result["p50_ms"]:.2f} '
+                    f'мс ({change:+.0f}%), запросов '
+                    f'{before["queries"]} → {result["queries"]}'
+                )
+                if (
+                    change > threshold
+                    or result['queries'] > before['queries']
+                ):
+                    regressions += 1
+                    self.stdout.write(self.style.ERROR(line))
+                else:
+                    self.stdout.write(line)
+        style = self.style.ERROR if regressions else self.style.SUCCESS
+        self.stdout.write(style(f'Регрессий: {regressions}.'))
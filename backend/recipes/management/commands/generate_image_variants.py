@@ -0,0 +1,48 @@
+from django.core.management import BaseCommand
+from django.utils import timezone
+from PIL import Image
+from recipes.cache import invalidate_recipe
+from recipes.images import delete_variants, flatten, save_variants
+from recipes.models import ImageStatus, Recipe
+
+
+class Command(BaseCommand):
+    help = ('Создаёт уменьшенные копии картинок рецептов, '
+            'загруженных до появления копий.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии и для рецептов, у которых они есть.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.filter(
+            image_status=ImageStatus.READY
+        ).exclude(image='').only('id', 'image', 'image_variants')
+        if not options['force']:
+            recipes = recipes.filter(image_variants=[])
+        processed = failed = 0
+        for recipe in recipes.iterator():
+            storage = recipe.image.storage
+            try:
+                with storage.open(recipe.image.name, 'rb') as file:
+                    image = flatten(Image.open(file))
+            except (OSError, ValueError, Image.DecompressionBombError):
+                failed += 1
+                self.stderr.write(
+                    f'Не удалось открыть картинку рецепта {recipe.id}: '
+                    f'{recipe.image.name}'
+                )
+                continue
+            delete_variants(storage, recipe.image.name,
+                            recipe.image_variants)
+            widths = save_variants(storage, recipe.image.name, image)
+            if Recipe.objects.filter(
+                id=recipe.id, image=recipe.image.name
+            ).update(image_variants=widths, updated_at=timezone.now()):
+                invalidate_recipe(recipe.id)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {processed}, с ошибкой: {failed}.'
+        ))
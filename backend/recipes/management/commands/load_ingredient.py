@@ -1,12 +1,156 @@
-from csv import DictReader
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from recipes import cache
 from recipes.models import Ingredient
 
+JSON_CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = ' \t\r\n,'
+
+
+def read_csv(file, delimiter):
+    for row in csv.reader(file, delimiter=delimiter):
+        if len(row) < 2:
+            continue
+        if [value.strip() for value in row[:2]] == [
+            'name', 'measurement_unit'
+        ]:
+            continue
+        yield row[0], row[1]
+
+
+def read_json(file):
+    """Читает массив объектов JSON по частям,
+    не загружая файл в память целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while (position < len(buffer)
+                   and buffer[position] in JSON_SEPARATORS):
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается массив JSON.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError('Файл JSON обрывается.')
+                break
+            try:
+                name, measurement_unit = item['name'], item['measurement_unit']
+            except (KeyError, TypeError):
+                name = measurement_unit = None
+            if not (isinstance(name, str)
+                    and isinstance(measurement_unit, str)):
+                raise CommandError(f'Некорректный элемент: {item!r}.')
+            yield name, measurement_unit
+        buffer = buffer[position:]
+        if not chunk:
+            return
+
 
 class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV или JSON пакетами. '
+            'Уже существующие ингредиенты пропускаются, поэтому '
+            'команду можно запускать повторно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='./ingredients.csv',
+            help='Путь к файлу ингредиентов (.csv или .json).'
+        )
+        parser.add_argument(
+            '--format', choices=('csv', 'json'),
+            help='Формат файла, по умолчанию по расширению.'
+        )
+        parser.add_argument(
+            '--delimiter', default=';',
+            help='Разделитель полей CSV, по умолчанию «;».'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одном INSERT.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Выполнить загрузку и откатить транзакцию.'
+        )
+
     def handle(self, *args, **options):
-        for row in DictReader(open('./ingredients.csv'), delimiter=";"):
-            print(row)
-            ingredient=Ingredient(name=row['name'], measurement_unit=row['measurement_unit'])
-            ingredient.save()
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f'Файл {path} не найден.')
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in ('csv', 'json'):
+            raise CommandError('Укажите формат файла: --format csv|json.')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+
+        started = time.monotonic()
+        with path.open(encoding='utf-8', newline='') as file:
+            if file_format == 'csv':
+                rows = read_csv(file, options['delimiter'])
+            else:
+                rows = read_json(file)
+            with transaction.atomic():
+                before = Ingredient.objects.count()
+                read, skipped = self.load(rows, batch_size)
+                created = Ingredient.objects.count() - before
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+                else:
+                    cache.ingredients.invalidate()
+        elapsed = time.monotonic() - started
+
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Прочитано строк: {read}, добавлено: {created}, '
+            f'пропущено некорректных: {skipped}. '
+            f'{elapsed:.2f} с, {read / elapsed if elapsed else read:.0f} '
+            f'строк/с.'
+        ))
+
+    def load(self, rows, batch_size):
+        name_length = Ingredient._meta.get_field('name').max_length
+        unit_length = Ingredient._meta.get_field(
+            'measurement_unit'
+        ).max_length
+        read = skipped = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                return read, skipped
+            read += len(chunk)
+            batch = []
+            for name, measurement_unit in chunk:
+                name, measurement_unit = (
+                    name.strip(), measurement_unit.strip()
+                )
+                if not (0 < len(name) <= name_length
+                        and 0 < len(measurement_unit) <= unit_length):
+                    skipped += 1
+                    continue
+                batch.append(Ingredient(
+                    name=name, measurement_unit=measurement_unit
+                ))
+            if batch:
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
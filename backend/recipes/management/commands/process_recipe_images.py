@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand
+from recipes.images import process_recipe_image
+from recipes.models import ImageStatus, Recipe
+
+
+class Command(BaseCommand):
+    help = ('Обрабатывает картинки рецептов, оставшиеся в ожидании '
+            '(например, после перезапуска сервера).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--failed', action='store_true',
+            help='Повторить обработку картинок с ошибкой.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.filter(image_status=ImageStatus.PENDING)
+        if options['failed']:
+            Recipe.objects.filter(image_status=ImageStatus.FAILED).update(
+                image_status=ImageStatus.PENDING
+            )
+        processed = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            process_recipe_image(recipe_id)
+            processed += 1
+        failed = Recipe.objects.filter(
+            image_status=ImageStatus.FAILED
+        ).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {processed}, с ошибкой: {failed}.'
+        ))
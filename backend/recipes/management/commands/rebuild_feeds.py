@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+from recipes.feed import rebuild_all
+
+
+class Command(BaseCommand):
+    help = ('Собирает заново ленты подписок пользователей, у которых '
+            'подписок не меньше FEED_TIMELINE_THRESHOLD, и удаляет '
+            'ленты остальных.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuilt = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Лент собрано: {rebuilt} (порог '
+            f'{settings.FEED_TIMELINE_THRESHOLD} подписок).'
+        ))
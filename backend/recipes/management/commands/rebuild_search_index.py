@@ -0,0 +1,10 @@
+from django.core.management import BaseCommand
+from recipes import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковые документы всех рецептов.'
+
+    def handle(self, *args, **options):
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран.'))
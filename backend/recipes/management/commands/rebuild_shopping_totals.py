@@ -0,0 +1,38 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from recipes import totals
+
+
+class Command(BaseCommand):
+    help = ('Сверяет итоги списков покупок с пересчётом по рецептам '
+            'в списках и заменяет их пересчитанными.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить, ничего не меняя. Завершается ошибкой, '
+                 'если есть расхождения.'
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            differences = totals.verify()
+        else:
+            with transaction.atomic():
+                differences = totals.rebuild()
+        for (user_id, ingredient_id), (current, expected) in sorted(
+            differences.items()
+        ):
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'{current} вместо {expected}'
+            )
+        if options['check']:
+            if differences:
+                raise CommandError(f'Расхождений: {len(differences)}.')
+            self.stdout.write(self.style.SUCCESS('Итоги совпадают.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Итоги пересчитаны, исправлено расхождений: '
+            f'{len(differences)}.'
+        ))
@@ -0,0 +1,69 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from recipes import benchmark
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Заполняет БД воспроизводимыми данными для замеров: '
+            'пользователи, рецепты, избранное, списки покупок и подписки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=100,
+            help='Количество пользователей.'
+        )
+        parser.add_argument(
+            '--recipes-per-user', type=float, default=3,
+            help='Среднее число рецептов у пользователя.'
+        )
+        parser.add_argument(
+            '--favorites-per-user', type=float, default=10,
+            help='Среднее число рецептов в избранном.'
+        )
+        parser.add_argument(
+            '--carts-per-user', type=float, default=3,
+            help='Среднее число рецептов в списке покупок.'
+        )
+        parser.add_argument(
+            '--follows-per-user', type=float, default=5,
+            help='Среднее число подписок.'
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=500,
+            help='Количество ингредиентов в справочнике.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=1,
+            help='Начальное значение генератора случайных чисел.'
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('--users должен быть больше нуля.')
+        if User.objects.filter(
+            username__startswith=benchmark.USERNAME_PREFIX
+        ).exists():
+            raise CommandError(
+                'Данные для замеров уже созданы. Очистите БД командой '
+                'flush и запустите заново.'
+            )
+        started = time.monotonic()
+        created = benchmark.seed(
+            users=options['users'],
+            recipes_per_user=options['recipes_per_user'],
+            favorites_per_user=options['favorites_per_user'],
+            carts_per_user=options['carts_per_user'],
+            follows_per_user=options['follows_per_user'],
+            ingredients=options['ingredients'],
+            random_seed=options['seed'],
+        )
+        for name, count in created.items():
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - started:.2f} с. '
+            f'Пароль пользователей: {benchmark.PASSWORD}'
+        ))
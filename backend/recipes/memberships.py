@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.db.models import IntegerField, Value
+
+from .cache import get_version, user_version
+from .models import Favorite, Follow, ShoppingList
+
+MEMBERSHIPS_KEY = 'foodgram:memberships:{}:{}'
+MEMBERSHIPS_TIMEOUT = 60 * 60 * 24
+REQUEST_ATTRIBUTE = '_foodgram_memberships'
+
+FAVORITE, SHOPPING_CART, FOLLOW = range(3)
+
+
+class Memberships:
+    """Множества id избранных рецептов, рецептов в списке покупок
+    и авторов в подписках пользователя.
+    """
+
+    def __init__(self, favorites=(), shopping_cart=(), following=()):
+        self.favorites = frozenset(favorites)
+        self.shopping_cart = frozenset(shopping_cart)
+        self.following = frozenset(following)
+
+
+EMPTY = Memberships()
+
+
+def load_memberships(user):
+    """Все три множества одним запросом UNION ALL."""
+    kind = IntegerField()
+    rows = Favorite.objects.filter(user=user).order_by().values_list(
+        'recipe_id', Value(FAVORITE, output_field=kind)
+    ).union(
+        ShoppingList.objects.filter(user=user).order_by().values_list(
+            'recipe_id', Value(SHOPPING_CART, output_field=kind)
+        ),
+        Follow.objects.filter(user=user).order_by().values_list(
+            'author_id', Value(FOLLOW, output_field=kind)
+        ),
+        all=True,
+    )
+    sets = ([], [], [])
+    for pk, kind in rows:
+        sets[kind].append(pk)
+    return Memberships(*sets)
+
+
+def get_memberships(user):
+    """Множества пользователя из общего кэша.
+    Ключ включает версию данных пользователя, которая сбрасывается
+    при любом изменении избранного, списка покупок или подписок,
+    поэтому устаревшие множества никогда не читаются.
+    """
+    if not user.is_authenticated:
+        return EMPTY
+    key = MEMBERSHIPS_KEY.format(user.id, get_version(user_version(user.id)))
+    memberships = cache.get(key)
+    if memberships is None:
+        memberships = load_memberships(user)
+        cache.set(key, memberships, MEMBERSHIPS_TIMEOUT)
+    return memberships
+
+
+def for_request(request):
+    """Множества текущего пользователя, загруженные один раз
+    за запрос.
+    """
+    if request is None:
+        return EMPTY
+    memberships = getattr(request, REQUEST_ATTRIBUTE, None)
+    if memberships is None:
+        memberships = get_memberships(request.user)
+        setattr(request, REQUEST_ATTRIBUTE, memberships)
+    return memberships
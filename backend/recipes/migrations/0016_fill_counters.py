@@ -0,0 +1,35 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'Favorite', 'recipe'),
+    ('recipes', 'Recipe', 'in_carts_count', 'ShoppingList', 'recipe'),
+    ('users', 'CustomUser', 'recipes_count', 'Recipe', 'author'),
+    ('users', 'CustomUser', 'followers_count', 'Follow', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app_label, model_name, field, source_name, foreign_key in COUNTERS:
+        model = apps.get_model(app_label, model_name)
+        source = apps.get_model('recipes', source_name)
+        model.objects.update(**{field: Coalesce(Subquery(
+            source.objects.filter(
+                **{foreign_key: OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                total=Count('pk')
+            ).values('total')
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_counters'),
+        ('users', '0006_customuser_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
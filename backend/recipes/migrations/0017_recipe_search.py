@@ -0,0 +1,75 @@
+from django.db import migrations
+
+POSTGRESQL_CREATE = (
+    '''
+    CREATE TABLE recipes_recipe_search (
+        recipe_id bigint PRIMARY KEY
+            REFERENCES recipes_recipe (id) ON DELETE CASCADE
+            DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    ''',
+    '''
+    CREATE INDEX recipes_recipe_search_document
+        ON recipes_recipe_search USING gin (document)
+    ''',
+    '''
+    INSERT INTO recipes_recipe_search (recipe_id, document)
+    SELECT r.id,
+           setweight(to_tsvector('russian', r.name), 'A')
+           || setweight(to_tsvector(
+               'russian', coalesce(string_agg(i.name, ' '), '')
+           ), 'B')
+           || setweight(to_tsvector('russian', r.text), 'C')
+    FROM recipes_recipe r
+    LEFT JOIN recipes_amountingredient a ON a.recipe_id = r.id
+    LEFT JOIN recipes_ingredient i ON i.id = a.ingredient_id
+    GROUP BY r.id
+    ''',
+)
+
+SQLITE_CREATE = (
+    '''
+    CREATE VIRTUAL TABLE recipes_recipe_search USING fts5(
+        name, ingredients, text, tokenize = 'unicode61'
+    )
+    ''',
+    '''
+    INSERT INTO recipes_recipe_search (rowid, name, ingredients, text)
+    SELECT r.id, r.name,
+           coalesce((
+               SELECT group_concat(i.name, ' ')
+               FROM recipes_amountingredient a
+               JOIN recipes_ingredient i ON i.id = a.ingredient_id
+               WHERE a.recipe_id = r.id
+           ), ''),
+           r.text
+    FROM recipes_recipe r
+    ''',
+)
+
+CREATE = {
+    'postgresql': POSTGRESQL_CREATE,
+    'sqlite': SQLITE_CREATE,
+}
+
+
+def create_search_table(apps, schema_editor):
+    for sql in CREATE.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(sql)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE:
+        schema_editor.execute('DROP TABLE recipes_recipe_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_fill_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
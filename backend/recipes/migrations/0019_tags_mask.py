@@ -0,0 +1,56 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:40
+
+from django.db import migrations, models
+from django.db.models import (BigIntegerField, ExpressionWrapper, F,
+                              OuterRef, Subquery, Sum, Value)
+from django.db.models.functions import Cast, Coalesce
+
+
+def fill_tags_mask(apps, schema_editor):
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    for bit, tag in enumerate(Tag.objects.order_by('id')):
+        tag.bit = bit
+        tag.save(update_fields=('bit',))
+    Recipe.objects.update(tags_mask=Coalesce(Subquery(
+        Tag.objects.filter(recipes=OuterRef('pk')).order_by().values(
+            'recipes'
+        ).annotate(mask=Sum(ExpressionWrapper(
+            Cast(Value(1), BigIntegerField()).bitleftshift(F('bit')),
+            output_field=BigIntegerField(),
+        ))).values('mask')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_recipe_cooking_time_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(
+                editable=False, null=True,
+                verbose_name='Бит в маске тегов рецепта',
+            ),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(
+                default=0, editable=False, verbose_name='Маска тегов',
+            ),
+        ),
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(
+                editable=False, unique=True,
+                verbose_name='Бит в маске тегов рецепта',
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+from django.db.models import Sum
+
+
+def fill_shopping_totals(apps, schema_editor):
+    AmountIngredient = apps.get_model('recipes', 'AmountIngredient')
+    ShoppingListTotal = apps.get_model('recipes', 'ShoppingListTotal')
+    rows = AmountIngredient.objects.filter(
+        recipe__purchases__isnull=False
+    ).values_list(
+        'recipe__purchases__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+    ShoppingListTotal.objects.bulk_create(
+        (ShoppingListTotal(user_id=user_id, ingredient_id=ingredient_id,
+                           total=total)
+         for user_id, ingredient_id, total in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_shoppinglisttotal'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_shopping_totals, migrations.RunPython.noop),
+    ]
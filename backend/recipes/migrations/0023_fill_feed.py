@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_feed(apps, schema_editor):
+    User = apps.get_model('users', 'CustomUser')
+    Follow = apps.get_model('recipes', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    User.objects.update(following_count=Coalesce(Subquery(
+        Follow.objects.filter(
+            user=OuterRef('pk')
+        ).order_by().values('user').annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0))
+    user_ids = User.objects.filter(
+        following_count__gte=settings.FEED_TIMELINE_THRESHOLD
+    ).values_list('pk', flat=True)
+    for user_id in list(user_ids):
+        FeedEntry.objects.bulk_create(
+            (FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                       pub_date=pub_date)
+             for recipe_id, pub_date in Recipe.objects.filter(
+                author__in=Follow.objects.filter(
+                    user_id=user_id
+                ).values('author')
+            ).values_list('id', 'pub_date').order_by().iterator()),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_feed'),
+        ('users', '0007_customuser_following_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
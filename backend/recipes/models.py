@@ -1,9 +1,17 @@
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.db.models import (BigIntegerField, ExpressionWrapper, F,
+                              OuterRef, Prefetch, Subquery, Sum, Value)
+from django.db.models.functions import Cast, Coalesce
 
 User = get_user_model()
 
+# Биты 0..62 маски тегов: маска остаётся положительным BigInteger.
+MAX_TAGS = 63
+TAGS_LIMIT_MESSAGE = f'Можно создать не больше {MAX_TAGS} тегов.'
+
 
 class Tag(models.Model):
     name = models.CharField('Название', max_length=200)
@@ -13,6 +21,11 @@ class Tag(models.Model):
         validators=[RegexValidator(regex=r'^#([A-Fa-f0-9]{6})$')],
     )
     slug = models.SlugField('Слаг', max_length=200)
+    bit = models.PositiveSmallIntegerField(
+        'Бит в маске тегов рецепта',
+        unique=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -22,6 +35,30 @@ class Tag(models.Model):
     def __str__(self):
         return f'{self.name} (цвет: {self.color})'
 
+    def clean(self):
+        if self.bit is None and self.free_bit() is None:
+            raise ValidationError(TAGS_LIMIT_MESSAGE)
+
+    def save(self, *args, **kwargs):
+        if self.bit is None:
+            self.bit = self.free_bit()
+            if self.bit is None:
+                raise ValidationError(TAGS_LIMIT_MESSAGE)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def free_bit(cls):
+        """Свободный бит маски или None, если заняты все."""
+        used = set(cls.objects.values_list('bit', flat=True))
+        for bit in range(MAX_TAGS):
+            if bit not in used:
+                return bit
+        return None
+
+    @property
+    def mask(self):
+        return 1 << self.bit
+
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -48,6 +85,61 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов рецептов с заготовками для выдачи через API."""
+
+    def update_tags_mask(self):
+        """Пересчитывает маску тегов по связям рецепта с тегами
+        одним запросом UPDATE.
+        """
+        return self.update(tags_mask=Coalesce(Subquery(
+            Tag.objects.filter(recipes=OuterRef('pk')).order_by().values(
+                'recipes'
+            ).annotate(mask=Sum(ExpressionWrapper(
+                Cast(Value(1), BigIntegerField()).bitleftshift(F('bit')),
+                output_field=BigIntegerField(),
+            ))).values('mask')
+        ), 0))
+
+    def with_tags(self, masks, match_all=False):
+        """Рецепты с любым (или со всеми при `match_all`) тегом
+        из `masks`: одна побитовая проверка без JOIN и DISTINCT.
+        """
+        mask = 0
+        for tag_mask in masks:
+            mask |= tag_mask
+        matched = self.alias(tags_matched=F('tags_mask').bitand(mask))
+        if match_all:
+            return matched.filter(tags_matched=mask)
+        return matched.exclude(tags_matched=0)
+
+    @staticmethod
+    def related_lookups():
+        """Связанные объекты, которые нужны для вывода рецепта.
+        Подходят и для `prefetch_related_objects` у готового рецепта.
+        """
+        return (
+            'author',
+            'tags',
+            Prefetch(
+                'recipes_amount',
+                queryset=AmountIngredient.objects.select_related(
+                    'ingredient'
+                ).order_by('pk'),
+            ),
+        )
+
+    def with_related(self):
+        """Подгружает теги, ингредиенты и автора рецепта."""
+        return self.prefetch_related(*self.related_lookups())
+
+
+class ImageStatus(models.TextChoices):
+    PENDING = 'pending', 'Обрабатывается'
+    READY = 'ready', 'Готова'
+    FAILED = 'failed', 'Ошибка обработки'
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -64,6 +156,17 @@ class Recipe(models.Model):
         'Картинка',
         upload_to='recipes/',
     )
+    image_status = models.CharField(
+        'Обработка картинки',
+        max_length=16,
+        choices=ImageStatus.choices,
+        default=ImageStatus.READY,
+    )
+    image_variants = models.JSONField(
+        'Ширины уменьшенных копий картинки',
+        default=list,
+        blank=True,
+    )
     text = models.TextField('Описание')
     ingredients = models.ManyToManyField(
         verbose_name='Ингредиенты блюда',
@@ -88,15 +191,60 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    tags_mask = models.BigIntegerField(
+        verbose_name='Маска тегов',
+        default=0,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    # Меняются только запросами update() с выражениями. Обычное
+    # сохранение загруженного рецепта их не записывает, иначе
+    # устаревшие значения экземпляра затрут параллельные изменения.
+    derived_fields = ('tags_mask', 'favorites_count', 'in_carts_count')
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(
+                fields=('cooking_time', '-pub_date'),
+                name='recipe_cooking_time_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.derived_fields
+            ]
+        super().save(*args, **kwargs)
+
 
 class AmountIngredient(models.Model):
     recipe = models.ForeignKey(
@@ -217,3 +365,79 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'Рецепт {self.recipe} в списке покупок у {self.user}'
+
+
+class ShoppingListTotal(models.Model):
+    """Сумма ингредиента по всем рецептам в списке покупок
+    пользователя. Поддерживается сигналами (`recipes.totals`),
+    сверяется и пересчитывается командой `rebuild_shopping_totals`.
+    Строки с нулевой суммой не удаляются, чтобы не мешать
+    одновременным изменениям, и в выгрузку не попадают.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_totals',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_totals',
+        verbose_name='Ингредиент',
+    )
+    total = models.PositiveBigIntegerField('Количество', default=0)
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='shopping_total_user_ingredient_unique'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient}: {self.total} у {self.user}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписок пользователя. Ленты хранятся только
+    у тех, кто подписан на `FEED_TIMELINE_THRESHOLD` авторов и больше,
+    и заполняются при публикации рецепта (`recipes.feed`).
+    Дата публикации повторяет дату рецепта, чтобы страница ленты
+    читалась по индексу без соединения с рецептами.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='feed_entry_user_recipe_unique'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_entry_user_pub_date_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'Рецепт {self.recipe} в ленте {self.user}'
@@ -0,0 +1,200 @@
+from django.db import connection, transaction
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import AmountIngredient, Ingredient, Recipe
+
+SEARCH_TABLE = 'recipes_recipe_search'
+CHUNK_SIZE = 500
+
+
+def chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+class SearchBackend:
+    """Поисковый документ рецепта: название, описание и названия
+    ингредиентов. Документы хранятся в отдельной таблице и
+    обновляются одним запросом INSERT ... SELECT на пачку рецептов.
+    """
+    tables = {
+        'search': SEARCH_TABLE,
+        'recipe': Recipe._meta.db_table,
+        'amount': AmountIngredient._meta.db_table,
+        'ingredient': Ingredient._meta.db_table,
+    }
+
+    def update(self, recipe_ids):
+        raise NotImplementedError
+
+    def delete(self, recipe_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    """tsvector с русской конфигурацией и индексом GIN.
+    Вес A у названия, B у ингредиентов, C у описания.
+    """
+    config = 'russian'
+    update_sql = '''
+        INSERT INTO {search} (recipe_id, document)
+        SELECT r.id,
+               setweight(to_tsvector(%s, r.name), 'A')
+               || setweight(to_tsvector(
+                   %s, coalesce(string_agg(i.name, ' '), '')
+               ), 'B')
+               || setweight(to_tsvector(%s, r.text), 'C')
+        FROM {recipe} r
+        LEFT JOIN {amount} a ON a.recipe_id = r.id
+        LEFT JOIN {ingredient} i ON i.id = a.ingredient_id
+        WHERE r.id = ANY(%s)
+        GROUP BY r.id
+        ON CONFLICT (recipe_id) DO UPDATE SET document = EXCLUDED.document
+    '''
+
+    def update(self, recipe_ids):
+        sql = self.update_sql.format(**self.tables)
+        with connection.cursor() as cursor:
+            for ids in chunks(recipe_ids):
+                cursor.execute(sql, (self.config,) * 3 + (ids,))
+
+    def delete(self, recipe_ids):
+        # Строки удаляются каскадно вместе с рецептом.
+        pass
+
+    def search(self, queryset, query):
+        params = (self.config, query)
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT recipe_id FROM {SEARCH_TABLE} '
+            f'WHERE document @@ websearch_to_tsquery(%s, %s)', params
+        )).annotate(search_rank=RawSQL(
+            f'SELECT ts_rank(document, websearch_to_tsquery(%s, %s)) '
+            f'FROM {SEARCH_TABLE} '
+            f'WHERE recipe_id = {Recipe._meta.db_table}.id', params,
+            output_field=FloatField(),
+        ))
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """Виртуальная таблица FTS5, rowid совпадает с id рецепта.
+    Слова запроса ищутся по началу, все слова обязательны.
+    """
+    update_sql = '''
+        INSERT INTO {search} (rowid, name, ingredients, text)
+        SELECT r.id, r.name,
+               coalesce((
+                   SELECT group_concat(i.name, ' ')
+                   FROM {amount} a
+                   JOIN {ingredient} i ON i.id = a.ingredient_id
+                   WHERE a.recipe_id = r.id
+               ), ''),
+               r.text
+        FROM {recipe} r
+        WHERE r.id IN ({placeholders})
+    '''
+    # Веса столбцов name, ingredients, text для bm25.
+    weights = '10.0, 5.0, 1.0'
+
+    def update(self, recipe_ids):
+        with connection.cursor() as cursor:
+            for ids in chunks(recipe_ids):
+                self._delete(cursor, ids)
+                cursor.execute(self.update_sql.format(
+                    placeholders=', '.join(['%s'] * len(ids)),
+                    **self.tables
+                ), ids)
+
+    def delete(self, recipe_ids):
+        with connection.cursor() as cursor:
+            for ids in chunks(recipe_ids):
+                self._delete(cursor, ids)
+
+    def _delete(self, cursor, ids):
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN '
+            f'({", ".join(["%s"] * len(ids))})', ids
+        )
+
+    @staticmethod
+    def match_expression(query):
+        words = query.split()
+        return ' '.join(
+            '"{}"*'.format(word.replace('"', '""')) for word in words
+        )
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s', (match,)
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({SEARCH_TABLE}, {self.weights}) '
+            f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            f'AND rowid = {Recipe._meta.db_table}.id', (match,),
+            output_field=FloatField(),
+        ))
+
+
+class FallbackSearchBackend(SearchBackend):
+    """Для остальных СУБД: поиск по вхождению в название."""
+
+    def update(self, recipe_ids):
+        pass
+
+    def delete(self, recipe_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, queryset, query):
+        return queryset.filter(name__icontains=query)
+
+
+BACKENDS = {
+    'postgresql': PostgreSQLSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, FallbackSearchBackend)()
+
+
+def search(queryset, query):
+    """Рецепты, подходящие под запрос, с аннотацией `search_rank`
+    (чем больше, тем выше в выдаче), если СУБД её поддерживает.
+    """
+    return get_backend().search(queryset, query)
+
+
+def schedule_update(recipe_ids):
+    """Обновляет документы после фиксации транзакции,
+    когда ингредиенты рецепта уже записаны.
+    """
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: get_backend().update(recipe_ids))
+
+
+def schedule_delete(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: get_backend().delete(recipe_ids))
+
+
+def rebuild():
+    backend = get_backend()
+    with transaction.atomic():
+        backend.clear()
+        backend.update(Recipe.objects.values_list('id', flat=True))
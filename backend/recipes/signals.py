@@ -0,0 +1,227 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from import_export.signals import post_import
+
+from . import cache, counters, feed, search, totals
+from .models import (AmountIngredient, Favorite, Follow, Ingredient, Recipe,
+                     ShoppingList, Tag)
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    cache.tags.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient(sender, instance, **kwargs):
+    cache.ingredients.invalidate(
+        ({instance.id: (instance.name, instance.measurement_unit)}, ())
+    )
+
+
+@receiver(post_delete, sender=Ingredient)
+def delete_ingredient(sender, instance, **kwargs):
+    cache.ingredients.invalidate(({}, (instance.id,)))
+
+
+@receiver(post_import)
+def invalidate_imported(sender, model, **kwargs):
+    if model is Tag:
+        cache.tags.invalidate()
+    elif model is Ingredient:
+        cache.ingredients.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    cache.invalidate_recipe(instance.id)
+
+
+@receiver((post_save, post_delete), sender=AmountIngredient)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    cache.invalidate_recipe(instance.recipe_id)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingList)
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_user_state(sender, instance, **kwargs):
+    cache.invalidate(cache.user_version(instance.user_id))
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_users(sender, update_fields=None, **kwargs):
+    # Вход в систему обновляет только last_login, он не публикуется.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    cache.invalidate('users')
+
+
+def update_counters(sender, instance, delta):
+    for model, field, source, foreign_key in counters.COUNTERS:
+        if source is sender:
+            counters.change(model, getattr(instance, f'{foreign_key}_id'),
+                            field, delta)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Follow)
+def increment_counter(sender, instance, created, **kwargs):
+    if created:
+        update_counters(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Follow)
+def decrement_counter(sender, instance, **kwargs):
+    update_counters(sender, instance, -1)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_author(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding:
+        return
+    if update_fields is not None and not {'author', 'author_id'} & set(
+        update_fields
+    ):
+        # Автор не сохраняется, лишний запрос не нужен.
+        instance._saved_author_id = instance.author_id
+    else:
+        instance._saved_author_id = Recipe.objects.filter(
+            pk=instance.pk
+        ).values_list('author_id', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe(sender, instance, created, **kwargs):
+    if created:
+        counters.change(User, instance.author_id, 'recipes_count', 1)
+        return
+    saved_author_id = getattr(instance, '_saved_author_id', None)
+    if saved_author_id != instance.author_id:
+        counters.change(User, saved_author_id, 'recipes_count', -1)
+        counters.change(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def uncount_recipe(sender, instance, **kwargs):
+    counters.change(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, **kwargs):
+    search.schedule_update((instance.id,))
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, **kwargs):
+    search.schedule_delete((instance.id,))
+
+
+@receiver((post_save, post_delete), sender=AmountIngredient)
+def index_recipe_ingredients(sender, instance, **kwargs):
+    search.schedule_update((instance.recipe_id,))
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        search.schedule_update(AmountIngredient.objects.filter(
+            ingredient=instance
+        ).values_list('recipe_id', flat=True).distinct())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tags_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # После очистки со стороны тега список рецептов уже не узнать.
+        instance._cleared_recipe_ids = list(
+            instance.recipes.values_list('id', flat=True)
+        )
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        recipes = Recipe.objects.filter(id=instance.id)
+    elif action == 'post_clear':
+        recipes = Recipe.objects.filter(
+            id__in=instance.__dict__.pop('_cleared_recipe_ids', ())
+        )
+    else:
+        recipes = Recipe.objects.filter(id__in=pk_set)
+    recipes.update_tags_mask()
+
+
+@receiver(post_delete, sender=Tag)
+def clear_tag_bit(sender, instance, **kwargs):
+    Recipe.objects.with_tags((instance.mask,)).update(
+        tags_mask=F('tags_mask').bitand(~instance.mask)
+    )
+
+
+@receiver(post_save, sender=ShoppingList)
+def add_to_shopping_totals(sender, instance, created, **kwargs):
+    if created:
+        totals.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingList)
+def remove_from_shopping_totals(sender, instance, **kwargs):
+    # При удалении рецепта каскадом его ингредиенты могут быть удалены
+    # раньше покупки: тогда их уже вычел `remove_amount_from_totals`.
+    totals.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_save, sender=AmountIngredient)
+def remember_amount(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._saved_amount = AmountIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=AmountIngredient)
+def update_shopping_totals(sender, instance, created, **kwargs):
+    saved = None if created else getattr(instance, '_saved_amount', None)
+    if saved is not None and saved[0] != instance.recipe_id:
+        totals.change_recipe(saved[0], {saved[1]: -saved[2]})
+        saved = None
+    deltas = {instance.ingredient_id: instance.amount}
+    if saved is not None:
+        _, ingredient_id, amount = saved
+        deltas[ingredient_id] = deltas.get(ingredient_id, 0) - amount
+    totals.change_recipe(instance.recipe_id, deltas)
+
+
+@receiver(post_delete, sender=AmountIngredient)
+def remove_amount_from_totals(sender, instance, **kwargs):
+    totals.change_recipe(instance.recipe_id,
+                         {instance.ingredient_id: -instance.amount})
+
+
+@receiver(post_save, sender=Recipe)
+def publish_to_feeds(sender, instance, created, **kwargs):
+    if created:
+        feed.publish(instance)
+    elif getattr(instance, '_saved_author_id',
+                 instance.author_id) != instance.author_id:
+        feed.publish(instance, replace=True)
+
+
+# Подключены после `increment_counter` и `decrement_counter`:
+# порог ленты сравнивается с уже изменённым числом подписок.
+@receiver(post_save, sender=Follow)
+def add_author_to_feed(sender, instance, created, **kwargs):
+    if created:
+        feed.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_author_from_feed(sender, instance, **kwargs):
+    feed.unfollow(instance.user_id, instance.author_id)
@@ -1,3 +1,1930 @@
-from django.test import TestCase
+import json
+import posixpath
+import shutil
+import tempfile
+from base64 import b64encode, urlsafe_b64encode
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from api import metrics, representations
+from api.filters import RecipeFilter
+from api.paginators import PageLimitPagination
+from api.parsers import ORJSONParser
+from api.renderers import ORJSONRenderer
+from api.serializers import (CreateUpdateRecipeSerializer,
+                             ListRecipeSerializer, RecipeDetailSerializer)
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models.functions import Length
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from users.serializers import UserSerializer
+
+from . import benchmark, memberships, totals
+from .admin_tools import EstimatedCountPaginator, estimate_count
+from .cache import IngredientCatalog
+from .images import process_recipe_image, variant_name
+from .models import (MAX_TAGS, AmountIngredient, Favorite, FeedEntry, Follow,
+                     ImageStatus, Ingredient, Recipe, RecipeQuerySet,
+                     ShoppingList, ShoppingListTotal, Tag)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+User = get_user_model()
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Количество запросов к БД на странице рецептов
+    не должно зависеть от размера страницы.
+    """
+
+    # Включая загрузку множеств избранного, покупок и подписок.
+    MAX_QUERIES = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.org', password='pass'
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.org',
+                password='pass'
+            ) for i in range(3)
+        ]
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color='#FFFFFF',
+                               slug=f'tag{i}')
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(5)
+        ]
+        for i in range(12):
+            recipe = Recipe.objects.create(
+                author=authors[i % len(authors)], name=f'Рецепт {i}',
+                image='recipes/Fried_eggs.jpg', text='Описание',
+                cooking_time=10,
+            )
+            recipe.tags.set(tags[:i % len(tags) + 1])
+            AmountIngredient.objects.bulk_create(
+                AmountIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=i + 1)
+                for ingredient in ingredients
+            )
+            if i % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if i % 3:
+                ShoppingList.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=authors[0])
+
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, limit):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(context.captured_queries), response.data['results']
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        self.client.force_authenticate(self.user)
+        small, _ = self.count_queries(2)
+        large, results = self.count_queries(12)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, self.MAX_QUERIES)
+        for item in results:
+            recipe = Recipe.objects.get(id=item['id'])
+            self.assertEqual(
+                item['is_favorited'],
+                Favorite.objects.filter(user=self.user,
+                                        recipe=recipe).exists()
+            )
+            self.assertEqual(
+                item['is_in_shopping_cart'],
+                ShoppingList.objects.filter(user=self.user,
+                                            recipe=recipe).exists()
+            )
+            self.assertEqual(
+                item['author']['is_subscribed'],
+                Follow.objects.filter(user=self.user,
+                                      author=recipe.author).exists()
+            )
+            self.assertEqual(len(item['ingredients']), 5)
+
+    def test_anonymous_list_queries_do_not_depend_on_page_size(self):
+        small, _ = self.count_queries(2)
+        large, results = self.count_queries(12)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, self.MAX_QUERIES)
+        self.assertFalse(any(item['is_favorited'] for item in results))
+
+
+class RecipeCursorPaginationTest(APITestCase):
+    """Курсорная пагинация списка рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.org', password='pass'
+        )
+        recipes = [
+            Recipe.objects.create(author=author, name=f'Рецепт {i}',
+                                  image='recipes/Fried_eggs.jpg',
+                                  text='Описание')
+            for i in range(7)
+        ]
+        # Одинаковая дата публикации проверяет сортировку по id.
+        Recipe.objects.filter(
+            id__in=[recipe.id for recipe in recipes[2:5]]
+        ).update(pub_date=recipes[2].pub_date)
+        cls.expected = list(
+            Recipe.objects.order_by('-pub_date', '-id')
+            .values_list('id', flat=True)
+        )
+
+    def test_walk_forward_and_back(self):
+        response = self.client.get('/api/recipes/',
+                                   {'cursor': '', 'limit': 3})
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        pages = [[item['id'] for item in response.data['results']]]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append([item['id'] for item in response.data['results']])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in response.data['results']], pages[1]
+        )
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in response.data['results']], pages[0]
+        )
+        self.assertIsNone(response.data['previous'])
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get('/api/recipes/', {'page': 2, 'limit': 3})
+        self.assertEqual(response.data['count'], len(self.expected))
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIn('page=3', response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def paginate(self, queryset, url, params=None):
+        paginator = PageLimitPagination()
+        request = Request(APIRequestFactory().get(url, params))
+        page = paginator.paginate_queryset(queryset, request)
+        return [recipe.id for recipe in page], paginator.get_next_link()
+
+    def test_annotation_and_related_ordering(self):
+        queryset = Recipe.objects.annotate(
+            name_length=Length('name')
+        ).order_by('author__username', '-name_length', '-id')
+        page, link = self.paginate(queryset, '/api/recipes/',
+                                   {'cursor': '', 'limit': 4})
+        pages = [page]
+        while link:
+            page, link = self.paginate(queryset, link)
+            pages.append(page)
+        self.assertEqual(pages, [self.expected[:4], self.expected[4:]])
+
+        cursor = urlsafe_b64encode(b'{"p":["x","y"]}').decode()
+        for ordering in ('-pub_date__year', 'author__date_joined__date'):
+            with self.subTest(ordering=ordering):
+                with self.assertRaises(NotFound):
+                    self.paginate(queryset.order_by(ordering, 'pk'),
+                                  '/api/recipes/', {'cursor': cursor})
+
+
+class ShoppingCartDownloadTest(APITestCase):
+    """Выгрузка сводного списка покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@example.org', password='pass'
+        )
+        potato = Ingredient.objects.create(name='Картофель',
+                                           measurement_unit='г')
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        for amounts in ((100, 5), (250, 10), (50, None)):
+            recipe = Recipe.objects.create(
+                author=cls.user, name='Рецепт',
+                image='recipes/Fried_eggs.jpg', text='Описание'
+            )
+            AmountIngredient.objects.create(recipe=recipe,
+                                            ingredient=potato,
+                                            amount=amounts[0])
+            if amounts[1]:
+                AmountIngredient.objects.create(recipe=recipe,
+                                                ingredient=salt,
+                                                amount=amounts[1])
+            ShoppingList.objects.create(user=cls.user, recipe=recipe)
+        Recipe.objects.create(author=cls.user, name='Не в корзине',
+                              image='recipes/Fried_eggs.jpg',
+                              text='Описание')
+
+    def download(self, file_format):
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/',
+                {'file_format': file_format}
+            )
+            content = b''.join(response.streaming_content)
+        self.assertEqual(len(context.captured_queries), 1)
+        return response, content.decode()
+
+    def test_txt(self):
+        response, content = self.download('txt')
+        self.assertEqual(
+            content, 'Список покупок\n\nКартофель, 400 г\nСоль, 15 г'
+        )
+        self.assertIn('buyer_shopping_list.txt',
+                      response['Content-Disposition'])
+
+    def test_csv_and_json(self):
+        _, content = self.download('csv')
+        self.assertEqual(content.splitlines()[1:],
+                         ['Картофель,400,г', 'Соль,15,г'])
+        _, content = self.download('json')
+        self.assertEqual(json.loads(content), [
+            {'name': 'Картофель', 'amount': 400, 'measurement_unit': 'г'},
+            {'name': 'Соль', 'amount': 15, 'measurement_unit': 'г'},
+        ])
+
+    def test_unknown_format(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/recipes/download_shopping_cart/',
+                                   {'file_format': 'doc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeIngredientsWriteTest(APITestCase):
+    """Изменение ингредиентов рецепта пакетными запросами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.org', password='pass'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#00FF00',
+                                     slug='lunch')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(30)
+        ]
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Суп', image='recipes/Fried_eggs.jpg',
+            text='Описание'
+        )
+        cls.recipe.tags.set([cls.tag])
+        AmountIngredient.objects.bulk_create(
+            AmountIngredient(recipe=cls.recipe, ingredient=ingredient,
+                             amount=10)
+            for ingredient in cls.ingredients
+        )
+
+    def setUp(self):
+        # Справочники в тестах меняются без фиксации транзакций.
+        cache.clear()
+
+    def test_update_writes_only_the_diff(self):
+        extra = Ingredient.objects.create(name='Перец', measurement_unit='г')
+        payload = [
+            {'id': ingredient.id, 'amount': 10}
+            for ingredient in self.ingredients[1:]
+        ]
+        payload[0]['amount'] = 20
+        payload.append({'id': extra.id, 'amount': 5})
+        self.client.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/',
+                {'ingredients': payload, 'tags': [self.tag.id]},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        writes = [
+            query for query in context.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+        # UPDATE рецепта, DELETE, UPDATE количества, INSERT.
+        self.assertEqual(len(writes), 4)
+        self.assertEqual(
+            dict(self.recipe.recipes_amount.values_list('ingredient_id',
+                                                        'amount')),
+            {item['id']: item['amount'] for item in payload}
+        )
+
+
+class ReferenceCacheTest(APITestCase):
+    """Теги и ингредиенты отдаются из кэша процесса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Завтрак', color='#FF0000',
+                                     slug='breakfast')
+        Ingredient.objects.create(name='Яблоко', measurement_unit='шт')
+        Ingredient.objects.create(name='ябЛочный сок', measurement_unit='мл')
+        Ingredient.objects.create(name='Груша', measurement_unit='шт')
+        Ingredient.objects.create(name='Сушёные яблоки',
+                                  measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_tags_are_served_from_cache_and_invalidated(self):
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/')
+            self.client.get(f'/api/tags/{self.tag.id}/')
+        self.assertEqual(response.data, [{
+            'id': self.tag.id, 'name': 'Завтрак', 'color': '#FF0000',
+            'slug': 'breakfast',
+        }])
+        self.tag.name = 'Ужин'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.save()
+        response = self.client.get(f'/api/tags/{self.tag.id}/')
+        self.assertEqual(response.data['name'], 'Ужин')
+        response = self.client.get('/api/tags/0/')
+        self.assertEqual(response.status_code, 404)
+
+    def search(self, name, **params):
+        response = self.client.get('/api/ingredients/',
+                                   {'name': name, **params})
+        return [item['name'] for item in response.data]
+
+    def test_ingredient_autocomplete(self):
+        self.client.get('/api/ingredients/')
+        with self.assertNumQueries(0):
+            names = self.search('ЯБЛ')
+        self.assertEqual(names,
+                         ['Яблоко', 'ябЛочный сок', 'Сушёные яблоки'])
+        self.assertEqual(self.search('ябл', measurement_unit='шт'),
+                         ['Яблоко'])
+
+    def test_autocomplete_index_is_updated_in_place(self):
+        self.client.get('/api/ingredients/')
+        pear = Ingredient.objects.get(name='Груша')
+        pear.name = 'Яблочная груша'
+        with self.captureOnCommitCallbacks(execute=True):
+            pear.save()
+            Ingredient.objects.get(name='Яблоко').delete()
+        with self.assertNumQueries(0):
+            names = self.search('ябл')
+        self.assertEqual(names,
+                         ['Яблочная груша', 'ябЛочный сок',
+                          'Сушёные яблоки'])
+
+    def test_saves_are_applied_to_index_once(self):
+        self.client.get('/api/ingredients/')
+        with mock.patch.object(IngredientCatalog, 'updated',
+                               autospec=True,
+                               side_effect=IngredientCatalog.updated
+                               ) as updated:
+            for number in range(20):
+                with self.captureOnCommitCallbacks(execute=True):
+                    Ingredient.objects.create(name=f'Яблоко {number}',
+                                              measurement_unit='г')
+            with self.captureOnCommitCallbacks(execute=True):
+                Ingredient.objects.get(name='Яблоко 0').delete()
+                Ingredient.objects.filter(name='Яблоко 1').update(
+                    name='Груша 1'
+                )
+                Ingredient.objects.get(name='Груша 1').save()
+            with self.assertNumQueries(0):
+                names = self.search('ябл')
+                self.assertEqual(self.search('груша'), ['Груша', 'Груша 1'])
+        self.assertEqual(updated.call_count, 1)
+        self.assertEqual(names[:3], ['Яблоко', 'Яблоко 10', 'Яблоко 11'])
+        self.assertNotIn('Яблоко 0', names)
+
+
+class LoadIngredientCommandTest(APITestCase):
+    """Загрузка ингредиентов из CSV и JSON."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, filename, content):
+        path = self.directory / filename
+        path.write_text(content, encoding='utf-8')
+        return str(path)
+
+    def load(self, *args):
+        out = StringIO()
+        call_command('load_ingredient', *args, '--batch-size', '2',
+                     stdout=out)
+        return out.getvalue()
+
+    def ingredients(self):
+        return sorted(Ingredient.objects.values_list(
+            'name', 'measurement_unit'
+        ))
+
+    def test_csv(self):
+        path = self.write('ingredients.csv', (
+            'name,measurement_unit\n'
+            'соль,г\n'
+            ' сахар , г\n'
+            'молоко\n'
+            ',шт\n'
+            f'{"я" * 201},г\n'
+            'яйца,шт\n'
+        ))
+        output = self.load(path, '--delimiter', ',')
+        self.assertIn('Прочитано строк: 5, добавлено: 3, '
+                      'пропущено некорректных: 2.', output)
+        self.assertEqual(self.ingredients(),
+                         [('сахар', 'г'), ('соль', 'г'), ('яйца', 'шт')])
+
+        path = self.write('more.txt', 'соль;г\nперец;г\n')
+        output = self.load(path, '--format', 'csv')
+        self.assertIn('добавлено: 1,', output)
+        self.assertEqual(len(self.ingredients()), 4)
+
+    def test_json_and_rerun(self):
+        items = [{'name': f'Ингредиент {i}', 'measurement_unit': 'г'}
+                 for i in range(5)]
+        path = self.write('ingredients.json', json.dumps(items))
+        with mock.patch(
+            'recipes.management.commands.load_ingredient.JSON_CHUNK_SIZE', 16
+        ):
+            self.assertIn('добавлено: 5,', self.load(path))
+            self.assertIn('Прочитано строк: 5, добавлено: 0,',
+                          self.load(path))
+        self.assertEqual(len(self.ingredients()), 5)
+
+    def test_dry_run(self):
+        path = self.write('ingredients.csv', 'соль;г\nсахар;г\n')
+        output = self.load(path, '--dry-run')
+        self.assertIn('[dry-run] Прочитано строк: 2, добавлено: 2,', output)
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_malformed_input(self):
+        cases = (
+            ('object.json', '{"name": "соль"}'),
+            ('truncated.json', '[{"name": "соль", "measurement_unit"'),
+            ('missing.json', '[{"name": "соль"}]'),
+            ('number.json', '[{"name": 1, "measurement_unit": "г"}]'),
+            ('ingredients.xml', '<ingredients/>'),
+        )
+        for filename, content in cases:
+            with self.subTest(filename=filename):
+                with self.assertRaises(CommandError):
+                    self.load(self.write(filename, content))
+        with self.assertRaises(CommandError):
+            self.load(str(self.directory / 'missing.csv'))
+        self.assertFalse(Ingredient.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, RECIPE_IMAGE_SYNC=True,
+                   RECIPE_IMAGE_MAX_DIMENSION=400)
+class RecipeImagePipelineTest(APITestCase):
+    """Обработка загруженной картинки рецепта."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='photographer', email='photo@example.org',
+            password='pass'
+        )
+        cls.tag = Tag.objects.create(name='Ужин', color='#0000FF',
+                                     slug='dinner')
+        cls.ingredient = Ingredient.objects.create(name='Рис',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.author)
+
+    def create_recipe(self, image):
+        return self.client.post('/api/recipes/', {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 100}],
+            'tags': [self.tag.id],
+            'image': image,
+            'name': 'Плов',
+            'text': 'Описание',
+            'cooking_time': 60,
+        }, format='json')
+
+    def test_image_is_downscaled_and_stripped(self):
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Поворот на 90 градусов.
+        exif[0x010F] = 'Camera'
+        Image.new('RGB', (1200, 600), 'red').save(buffer, 'JPEG',
+                                                  exif=exif)
+        image = 'data:image/jpeg;base64,' + b64encode(
+            buffer.getvalue()
+        ).decode()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_recipe(image)
+        self.assertEqual(response.status_code, 201)
+
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(recipe.image_status, ImageStatus.READY)
+        with Image.open(recipe.image.path) as processed:
+            self.assertEqual(processed.size, (200, 400))
+            self.assertFalse(processed.getexif())
+
+    @override_settings(RECIPE_IMAGE_VARIANT_WIDTHS=(100, 320))
+    def test_variants_are_generated(self):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 400), 'green').save(buffer, 'PNG')
+        image = 'data:image/png;base64,' + b64encode(
+            buffer.getvalue()
+        ).decode()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_recipe(image)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(recipe.image_variants, [100, 320])
+        for path, size in (('100.webp', (100, 50)),
+                           ('320.jpg', (320, 160))):
+            name = variant_name(recipe.image.name, *path.split('.'))
+            with recipe.image.storage.open(name) as file:
+                with Image.open(file) as variant:
+                    self.assertEqual(variant.size, size)
+
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        srcset = response.data['image_srcset']
+        self.assertEqual(set(srcset), {'webp', 'jpeg'})
+        self.assertTrue(srcset['webp'].endswith('/320.webp 320w'))
+        self.assertIn('/100.jpg 100w, ', srcset['jpeg'])
+
+    @override_settings(RECIPE_IMAGE_VARIANT_WIDTHS=(100, 320))
+    def test_replaced_image_files_are_deleted(self):
+        def png(color):
+            buffer = BytesIO()
+            Image.new('RGB', (800, 400), color).save(buffer, 'PNG')
+            return 'data:image/png;base64,' + b64encode(
+                buffer.getvalue()
+            ).decode()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_recipe(png('green'))
+        old = Recipe.objects.get(id=response.data['id'])
+        storage = old.image.storage
+        old_files = [old.image.name] + [
+            variant_name(old.image.name, width, extension)
+            for width in old.image_variants for extension in ('webp', 'jpg')
+        ]
+        self.assertTrue(all(storage.exists(name) for name in old_files))
+
+        url = f'/api/recipes/{old.id}/'
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(url, {'image': png('blue')},
+                                         format='json')
+        self.assertEqual(response.status_code, 200)
+        # До обработки ссылок на копии нет: их ещё не существует.
+        self.assertEqual(response.data['image_srcset'], {})
+        self.assertTrue(all(storage.exists(name) for name in old_files))
+
+        for callback in callbacks:
+            callback()
+        recipe = Recipe.objects.get(id=old.id)
+        self.assertEqual(recipe.image_status, ImageStatus.READY)
+        self.assertEqual(recipe.image_variants, [100, 320])
+        self.assertFalse(any(storage.exists(name) for name in old_files))
+        self.assertFalse(storage.exists(
+            posixpath.dirname(old_files[-1])
+        ))
+
+    def test_update_keeps_processed_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 400), 'blue').save(buffer, 'PNG')
+        image = 'data:image/png;base64,' + b64encode(
+            buffer.getvalue()
+        ).decode()
+        response = self.create_recipe(image)
+        recipe_id = response.data['id']
+        update = CreateUpdateRecipeSerializer.update
+
+        def process_and_update(serializer, instance, validated_data):
+            # Картинка обработана, пока рецепт менялся.
+            process_recipe_image(instance.id)
+            return update(serializer, instance, validated_data)
+
+        with mock.patch.object(CreateUpdateRecipeSerializer, 'update',
+                               process_and_update):
+            response = self.client.patch(f'/api/recipes/{recipe_id}/',
+                                         {'name': 'Плов с бараниной'},
+                                         format='json')
+        self.assertEqual(response.status_code, 200)
+        recipe = Recipe.objects.get(id=recipe_id)
+        self.assertEqual(recipe.name, 'Плов с бараниной')
+        self.assertEqual(recipe.image_status, ImageStatus.READY)
+        self.assertTrue(recipe.image.name.endswith('.jpg'))
+        self.assertTrue(recipe.image.storage.exists(recipe.image.name))
+
+    def test_broken_image_is_marked_failed(self):
+        image = b64encode(b'\xff\xd8\xff' + b'0' * 100).decode()
+        with self.assertLogs('recipes.images', 'WARNING'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.create_recipe(image)
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(recipe.image_status, ImageStatus.FAILED)
+
+    def test_unknown_type_is_rejected(self):
+        response = self.create_recipe(b64encode(b'plain text').decode())
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTest(APITestCase):
+    """Ответ 304 на повторный запрос без изменений."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='poller', email='poller@example.org', password='pass'
+        )
+        cls.other = User.objects.create_user(
+            username='other', email='other@example.org', password='pass'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#00FF00',
+                                     slug='lunch')
+        cls.recipe = Recipe.objects.create(
+            author=cls.other, name='Суп', image='recipes/soup.jpg',
+            text='Описание', cooking_time=30,
+        )
+        cls.recipe.tags.set([cls.tag])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def assertNotModified(self, url, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+    def test_tags_etag(self):
+        response = self.client.get('/api/tags/')
+        etag = response['ETag']
+        self.assertNotModified('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Ужин', color='#0000FF', slug='dinner')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+
+    def test_recipe_etag_depends_on_user_state(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotModified(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+
+        self.client.force_authenticate(self.other)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{url}favorite/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+
+    def test_recipe_update_changes_etag(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        detail_etag = self.client.get(url)['ETag']
+        list_etag = self.client.get('/api/recipes/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(id=self.recipe.id).save()
+        for path, etag in ((url, detail_etag),
+                           ('/api/recipes/', list_etag)):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+    def test_ingredient_amount_changes_etag(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.client.logout()
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        changes = (
+            lambda: AmountIngredient.objects.create(
+                recipe=self.recipe, ingredient=salt, amount=5
+            ),
+            lambda: AmountIngredient.objects.filter(
+                recipe=self.recipe
+            ).get().delete(),
+        )
+        for amounts, change in zip((1, 0), changes):
+            etag = self.client.get(url)['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['ingredients']), amounts)
+
+
+class MembershipsTest(APITestCase):
+    """Множества избранного, покупок и подписок пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='member', email='member@example.org', password='pass'
+        )
+        cls.author = User.objects.create_user(
+            username='chef', email='chef@example.org', password='pass'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {i}',
+                image='recipes/test.jpg', text='Описание', cooking_time=5,
+            ) for i in range(2)
+        ]
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+        ShoppingList.objects.create(user=cls.user, recipe=cls.recipes[1])
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_loaded_with_one_query_and_cached(self):
+        with self.assertNumQueries(1):
+            sets = memberships.get_memberships(self.user)
+        self.assertEqual(sets.favorites, {self.recipes[0].id})
+        self.assertEqual(sets.shopping_cart, {self.recipes[1].id})
+        self.assertEqual(sets.following, {self.author.id})
+        with self.assertNumQueries(0):
+            memberships.get_memberships(self.user)
+
+    def test_changes_are_visible_after_commit(self):
+        memberships.get_memberships(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, recipe=self.recipes[1])
+            Follow.objects.filter(user=self.user).delete()
+        sets = memberships.get_memberships(self.user)
+        self.assertEqual(sets.favorites, {r.id for r in self.recipes})
+        self.assertFalse(sets.following)
+
+
+class CountersTest(APITestCase):
+    """Счётчики избранного, покупок, рецептов и подписчиков."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='fan', email='fan@example.org', password='pass'
+        )
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.org', password='pass'
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Каша', image='recipes/test.jpg',
+            text='Описание', cooking_time=15,
+        )
+
+    def assertCounters(self, favorites, carts, recipes, followers):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.favorites_count, self.recipe.in_carts_count,
+             self.author.recipes_count, self.author.followers_count),
+            (favorites, carts, recipes, followers)
+        )
+
+    def test_save_keeps_concurrent_changes(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        author = User.objects.get(pk=self.author.pk)
+        user = User.objects.get(pk=self.user.pk)
+        # Пока экземпляры загружены, счётчики меняются в другом месте.
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Follow.objects.create(user=self.user, author=self.author)
+        recipe.name = 'Овсяная каша'
+        recipe.save()
+        author.first_name = 'Повар'
+        author.save()
+        user.first_name = 'Гость'
+        user.save()
+        self.assertCounters(1, 0, 1, 1)
+        self.assertEqual(self.recipe.name, 'Овсяная каша')
+        self.assertEqual(self.author.first_name, 'Повар')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 1)
+
+    def test_endpoints_update_counters(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.client.post(f'{url}favorite/')
+        self.client.post(f'{url}shopping_cart/')
+        response = self.client.post(
+            f'/api/users/{self.author.id}/subscribe/'
+        )
+        self.assertEqual(response.data['recipes_count'], 1)
+        self.assertCounters(1, 1, 1, 1)
+
+        self.client.delete(f'{url}favorite/')
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertCounters(0, 1, 1, 0)
+
+        self.recipe.author = self.user
+        self.recipe.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 1)
+        self.assertCounters(0, 1, 0, 0)
+
+    def test_partial_save_does_not_read_author(self):
+        self.recipe.name = 'Новое название'
+        with CaptureQueriesContext(connection) as queries:
+            self.recipe.save(update_fields=['name'])
+        self.assertFalse(any(
+            query['sql'].startswith('SELECT') for query in queries
+        ))
+        self.assertCounters(0, 0, 1, 0)
+
+        self.recipe.author = self.user
+        self.recipe.save(update_fields=['author'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 1)
+        self.assertCounters(0, 0, 0, 0)
+
+    def test_recount_repairs_drift(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Recipe.objects.filter(id=self.recipe.id).update(
+            favorites_count=5, in_carts_count=2
+        )
+        User.objects.filter(id=self.author.id).update(recipes_count=0)
+        out = StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn('recipe.favorites_count: исправлено строк 1',
+                      out.getvalue())
+        self.assertCounters(1, 0, 1, 0)
+
+
+class AdminChangeListTest(APITestCase):
+    """Списки объектов в админке на больших таблицах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.org', password='pass'
+        )
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        for number in range(5):
+            author = User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.org', password='pass',
+            )
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}',
+                image='recipes/test.jpg', text='Описание', cooking_time=5,
+            )
+            AmountIngredient.objects.create(recipe=recipe,
+                                            ingredient=ingredient, amount=1)
+            Follow.objects.create(user=cls.admin, author=author)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists_do_not_depend_on_row_count(self):
+        for url in ('/admin/recipes/recipe/',
+                    '/admin/recipes/amountingredient/',
+                    '/admin/recipes/follow/',
+                    '/admin/users/customuser/'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertLessEqual(len(queries), 6, url)
+
+    def test_autocomplete_filter(self):
+        author = Recipe.objects.first().author
+        response = self.client.get(
+            '/admin/recipes/recipe/', {'author__id__exact': author.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.assertContains(response, 'autocomplete_filter_author')
+        self.assertContains(response, 'admin/js/autocomplete.js')
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=3)
+    def test_estimated_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimate_count(Recipe), 5)
+        Recipe.objects.filter(name='Рецепт 0').delete()
+        paginator = EstimatedCountPaginator(Recipe.objects.all(), 2)
+        self.assertEqual(paginator.count, 5)
+        paginator = EstimatedCountPaginator(
+            Recipe.objects.filter(cooking_time=5), 2
+        )
+        self.assertEqual(paginator.count, 4)
+
+
+class RecipeSearchTest(APITestCase):
+    """Полнотекстовый поиск рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='writer', email='writer@example.org', password='pass'
+        )
+        cls.beet = Ingredient.objects.create(name='Свёкла',
+                                             measurement_unit='г')
+        cls.cabbage = Ingredient.objects.create(name='Капуста',
+                                                measurement_unit='г')
+
+    def create_recipe(self, name, text, ingredients):
+        recipe = Recipe.objects.create(
+            author=self.author, name=name, image='recipes/test.jpg',
+            text=text, cooking_time=30,
+        )
+        for ingredient in ingredients:
+            AmountIngredient.objects.create(recipe=recipe,
+                                            ingredient=ingredient, amount=1)
+        return recipe
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data['results']]
+
+    def test_search_is_ranked_and_incremental(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_recipe('Борщ', 'Суп со свёклой', [self.beet])
+            self.create_recipe('Салат', 'Как щи, только холодный',
+                               [self.beet, self.cabbage])
+            self.create_recipe('Щи', 'Суп', [self.cabbage])
+        self.assertEqual(self.search('борщ'), ['Борщ'])
+        self.assertEqual(self.search('щи'), ['Щи', 'Салат'])
+        self.assertEqual(self.search('свёкла суп'), ['Борщ'])
+        self.assertEqual(sorted(self.search('капуста')), ['Салат', 'Щи'])
+        self.assertEqual(self.search('"'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cabbage.name = 'Брокколи'
+            self.cabbage.save()
+        self.assertEqual(sorted(self.search('брокколи')), ['Салат', 'Щи'])
+        self.assertEqual(self.search('капуста'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(name='Щи').delete()
+        self.assertEqual(self.search('брокколи'), ['Салат'])
+
+    def test_search_cursor_pages(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                self.create_recipe(f'Суп {i}', 'Суп ' * i, [self.beet])
+            self.create_recipe('Салат', 'Без бульона', [self.cabbage])
+        expected = self.search('суп')
+        response = self.client.get('/api/recipes/', {
+            'search': 'суп', 'cursor': '', 'limit': 2,
+        })
+        names = [item['name'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertEqual(response.status_code, 200)
+            names += [item['name'] for item in response.data['results']]
+        self.assertEqual(names, expected)
+        self.assertEqual(len(names), 5)
+
+
+class RecipeIngredientFilterTest(APITestCase):
+    """Фильтры по ингредиентам и времени приготовления."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='cook', email='cook@example.org', password='pass'
+        )
+        cls.egg, cls.milk, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit='шт')
+            for name in ('Яйцо', 'Молоко', 'Мука')
+        )
+        for name, cooking_time, ingredients in (
+            ('Омлет', 10, (cls.egg, cls.milk)),
+            ('Блины', 40, (cls.egg, cls.milk, cls.flour)),
+            ('Яичница', 5, (cls.egg,)),
+        ):
+            recipe = Recipe.objects.create(
+                author=author, name=name, image='recipes/test.jpg',
+                text='Описание', cooking_time=cooking_time,
+            )
+            for ingredient in ingredients:
+                AmountIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+
+    def names(self, params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(item['name'] for item in response.data['results'])
+
+    def plan(self, params):
+        return RecipeFilter(params, queryset=Recipe.objects.all()).qs.explain()
+
+    def test_filters(self):
+        self.assertEqual(
+            self.names({'ingredients': f'{self.egg.id},{self.milk.id}'}),
+            ['Блины', 'Омлет']
+        )
+        self.assertEqual(
+            self.names({'exclude_ingredients': self.flour.id}),
+            ['Омлет', 'Яичница']
+        )
+        self.assertEqual(
+            self.names({'cooking_time_min': 6, 'cooking_time_max': 30}),
+            ['Омлет']
+        )
+        response = self.client.get('/api/recipes/', {'ingredients': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    @skipUnless(connection.vendor == 'sqlite', 'План запроса SQLite.')
+    def test_query_plans_use_indexes(self):
+        plan = self.plan({'cooking_time_max': '30'})
+        self.assertIn('USING INDEX recipe_cooking_time_idx', plan)
+        self.assertNotIn('SCAN recipes_recipe', plan)
+        for params in ({'ingredients': f'{self.egg.id},{self.milk.id}'},
+                       {'exclude_ingredients': str(self.flour.id)}):
+            plan = self.plan(params)
+            # EXISTS ищет строку по индексу (ingredient, recipe).
+            self.assertIn('(ingredient_id=? AND recipe_id=?)', plan)
+            self.assertNotIn('SCAN U0', plan)
+
+
+class RecipeTagsMaskTest(APITestCase):
+    """Маска тегов рецепта и фильтр по тегам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='tagger', email='tagger@example.org', password='pass'
+        )
+        cls.breakfast, cls.lunch, cls.dinner = (
+            Tag.objects.create(name=name, color='#FFFFFF', slug=slug)
+            for name, slug in (('Завтрак', 'breakfast'), ('Обед', 'lunch'),
+                               ('Ужин', 'dinner'))
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.recipes = {}
+        for name, tags in (('Каша', (self.breakfast,)),
+                           ('Суп', (self.lunch, self.dinner)),
+                           ('Рагу', (self.breakfast, self.dinner))):
+            recipe = Recipe.objects.create(
+                author=self.author, name=name, image='recipes/test.jpg',
+                text='Описание', cooking_time=20,
+            )
+            recipe.tags.set(tags)
+            self.recipes[name] = recipe
+
+    def names(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(
+            'DISTINCT' in query['sql'] for query in queries
+        ))
+        return sorted(item['name'] for item in response.data['results'])
+
+    def mask(self, name):
+        return Recipe.objects.get(id=self.recipes[name].id).tags_mask
+
+    def test_mask_follows_tag_changes(self):
+        recipe = self.recipes['Суп']
+        self.assertEqual(self.mask('Суп'),
+                         self.lunch.mask | self.dinner.mask)
+        recipe.tags.remove(self.dinner)
+        self.assertEqual(self.mask('Суп'), self.lunch.mask)
+        self.breakfast.recipes.add(recipe)
+        self.assertEqual(self.mask('Суп'),
+                         self.lunch.mask | self.breakfast.mask)
+        self.breakfast.recipes.clear()
+        self.assertEqual(self.mask('Суп'), self.lunch.mask)
+        self.assertEqual(self.mask('Каша'), 0)
+        self.lunch.delete()
+        self.assertEqual(self.mask('Суп'), 0)
+
+    def test_tag_delete_updates_tagged_recipes_only(self):
+        update = RecipeQuerySet.update
+        updated = []
+
+        def count_update(queryset, **kwargs):
+            updated.append(update(queryset, **kwargs))
+            return updated[-1]
+
+        with mock.patch.object(RecipeQuerySet, 'update', count_update):
+            self.dinner.delete()
+        self.assertEqual(updated, [2])
+        self.assertEqual(self.mask('Суп'), self.lunch.mask)
+        self.assertEqual(self.mask('Рагу'), self.breakfast.mask)
+        self.assertEqual(self.mask('Каша'), self.breakfast.mask)
+
+    def test_tags_limit(self):
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {bit}', color='#FFFFFF', slug=f'tag{bit}',
+                bit=bit)
+            for bit in range(3, MAX_TAGS)
+        )
+        with self.assertRaises(ValidationError):
+            Tag(name='Лишний', color='#FFFFFF', slug='extra').full_clean()
+
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.org', password='pass'
+        )
+        self.client.force_login(admin)
+        response = self.client.post('/admin/recipes/tag/add/', {
+            'name': 'Лишний', 'color': '#FFFFFF', 'slug': 'extra',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Можно создать не больше')
+        self.assertEqual(Tag.objects.count(), MAX_TAGS)
+
+    def test_bit_is_not_published(self):
+        recipe = self.recipes['Суп']
+        for url, tags in (
+            (f'/api/recipes/{recipe.id}/', lambda data: data['tags']),
+            ('/api/recipes/', lambda data: data['results'][0]['tags']),
+            ('/api/tags/', lambda data: data),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(set(tags(response.data)[0]),
+                                 {'id', 'name', 'color', 'slug'})
+
+    def test_filter_any_and_all(self):
+        self.assertEqual(self.names({'tags': ['lunch', 'breakfast']}),
+                         ['Каша', 'Рагу', 'Суп'])
+        self.assertEqual(self.names({'tags': 'dinner'}), ['Рагу', 'Суп'])
+        self.assertEqual(
+            self.names({'tags': ['breakfast', 'dinner'], 'tags_mode': 'all'}),
+            ['Рагу']
+        )
+        response = self.client.get('/api/recipes/', {'tags': 'brunch'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AsgiReadPathTest(APITestCase):
+    """Под ASGI представления отвечают так же, как под WSGI."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='async', email='async@example.org', password='pass'
+        )
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.org', password='pass'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tag = Tag.objects.create(name='Обед', color='#00FF00',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Суп', image='recipes/soup.jpg',
+            text='Описание', cooking_time=30,
+        )
+        cls.recipe.tags.set([cls.tag])
+        AmountIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=5
+        )
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.authorization = f'Token {self.token.key}'
+
+    async def assertSameAsSync(self, url, authorization=None):
+        # AsyncClient в Django 3.2 принимает заголовки по имени,
+        # тестовый клиент DRF — в виде ключей WSGI environ.
+        headers, environ = {}, {}
+        if authorization is not None:
+            headers['authorization'] = authorization
+            environ['HTTP_AUTHORIZATION'] = authorization
+        response = await self.async_client.get(url, **headers)
+        expected = await sync_to_async(self.client.get)(url, **environ)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), expected.json())
+        return response
+
+    async def test_same_responses(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.id}/',
+                    '/api/tags/', f'/api/tags/{self.tag.id}/',
+                    '/api/ingredients/?name=со', '/api/users/me/',
+                    '/api/users/subscriptions/?recipes_limit=1'):
+            with self.subTest(url=url):
+                await self.assertSameAsSync(url, self.authorization)
+        response = await self.assertSameAsSync(
+            f'/api/recipes/{self.recipe.id}/', self.authorization
+        )
+        self.assertTrue(response.json()['is_favorited'])
+
+    async def test_authentication(self):
+        response = await self.assertSameAsSync(
+            '/api/users/me/', 'Token invalid'
+        )
+        self.assertEqual(response.status_code, 401)
+        await self.assertSameAsSync('/api/users/me/')
+
+    def test_reference_and_not_modified_without_queries(self):
+        async def fetch(url, **headers):
+            return await self.async_client.get(url, **headers)
+
+        # Запросы в CaptureQueriesContext считаются только вне цикла
+        # событий.
+        get = async_to_sync(fetch)
+        get('/api/tags/')
+        url = f'/api/recipes/{self.recipe.id}/'
+        response = get(url, authorization=self.authorization)
+        with CaptureQueriesContext(connection) as queries:
+            tags = get('/api/tags/')
+            missing = get('/api/tags/0/')
+            response = get(
+                url, authorization=self.authorization,
+                if_none_match=response['ETag'],
+            )
+        self.assertEqual(tags.status_code, 200)
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(response.status_code, 304)
+        # Только проверка токена.
+        self.assertEqual(len(queries), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class BenchmarkTest(APITestCase):
+    """Генератор данных и прогон замеров."""
+
+    def setUp(self):
+        cache.clear()
+
+    def snapshot(self):
+        return (
+            sorted(Recipe.objects.values_list(
+                'author__username', 'name', 'cooking_time', 'tags_mask'
+            )),
+            sorted(AmountIngredient.objects.values_list(
+                'recipe__name', 'ingredient__name', 'amount'
+            )),
+            sorted(Favorite.objects.values_list(
+                'user__username', 'recipe__name'
+            )),
+            sorted(Follow.objects.values_list(
+                'user__username', 'author__username'
+            )),
+        )
+
+    def test_seed_is_reproducible(self):
+        created = benchmark.seed(users=10, ingredients=50, random_seed=3)
+        self.assertEqual(created['users'], 10)
+        self.assertEqual(Recipe.objects.count(), created['recipes'])
+        first = self.snapshot()
+        author = User.objects.order_by('-recipes_count').first()
+        self.assertEqual(author.recipes_count, author.recipes.count())
+
+        User.objects.filter(
+            username__startswith=benchmark.USERNAME_PREFIX
+        ).delete()
+        benchmark.seed(users=10, ingredients=50, random_seed=3)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_every_endpoint_is_measured(self):
+        benchmark.seed(users=10, ingredients=50)
+        results = benchmark.run(iterations=1)
+        self.assertEqual(
+            set(results),
+            {endpoint.name for endpoint in benchmark.ENDPOINTS}
+        )
+        for name, result in results.items():
+            with self.subTest(endpoint=name):
+                self.assertLess(result['status'], 400)
+                self.assertLessEqual(result['p50_ms'], result['max_ms'])
+
+
+class MetricsTest(APITestCase):
+    """Заголовок Server-Timing и метрики на /metrics."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='observer', email='observer@example.org',
+            password='pass'
+        )
+        Recipe.objects.create(
+            author=cls.user, name='Суп', image='recipes/soup.jpg',
+            text='Описание', cooking_time=30,
+        )
+
+    def setUp(self):
+        cache.clear()
+        metrics.REGISTRY.clear()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_TOKEN='secret')
+    def test_server_timing_and_metrics(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/')
+        count = len(queries)
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{count} SQL"', timing)
+        for name in ('db', 'serialize', 'render', 'total'):
+            self.assertIn(f'{name};dur=', timing)
+
+        response = self.client.get('/metrics',
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        labels = 'route="api/recipes/",method="GET"'
+        self.assertIn(
+            f'foodgram_requests_total{{{labels},status="200"}} 1', text
+        )
+        self.assertIn(
+            f'foodgram_db_queries_bucket{{{labels},le="+Inf"}} 1', text
+        )
+        self.assertIn(f'foodgram_db_queries_sum{{{labels}}} {count}', text)
+        self.assertIn(f'foodgram_response_size_bytes_count{{{labels}}} 1',
+                      text)
+
+    @override_settings(METRICS_ENABLED=True)
+    async def test_asgi(self):
+        response = await self.async_client.get('/api/tags/')
+        self.assertIn('desc="0 SQL"', response['Server-Timing'])
+        response = await self.async_client.get('/api/recipes/')
+        self.assertIn('render;dur=', response['Server-Timing'])
+
+    def test_disabled(self):
+        response = self.client.get('/api/recipes/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_metrics_require_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with self.settings(METRICS_TOKEN='secret'):
+            for authorization in (None, 'Bearer wrong', 'secret'):
+                with self.subTest(authorization=authorization):
+                    headers = {}
+                    if authorization is not None:
+                        headers['HTTP_AUTHORIZATION'] = authorization
+                    response = self.client.get('/metrics', **headers)
+                    self.assertEqual(response.status_code, 401)
+
+
+class ResponseCacheTest(APITestCase):
+    """Кэш ответов анонимным пользователям."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@example.org', password='pass'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#00FF00',
+                                     slug='lunch')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Суп', image='recipes/soup.jpg',
+            text='Описание', cooking_time=30,
+        )
+        cls.recipe.tags.set([cls.tag])
+
+    def setUp(self):
+        cache.clear()
+        caches['responses'].clear()
+        metrics.REGISTRY.clear()
+
+    def assertCached(self, path, expected):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response.data, expected)
+        return response
+
+    def test_normalized_parameters_hit_cache(self):
+        response = self.client.get('/api/recipes/?tags=lunch&page=1')
+        self.assertEqual(response.data['count'], 1)
+        self.assertCached('/api/recipes/?page=1&tags=lunch&search=',
+                          response.data)
+
+    def test_writes_invalidate(self):
+        data = self.client.get('/api/recipes/').data
+        self.assertCached('/api/recipes/', data)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(
+                author=self.user, name='Каша', image='recipes/soup.jpg',
+                text='Описание', cooking_time=10,
+            )
+        self.assertEqual(self.client.get('/api/recipes/').data['count'], 2)
+
+        tags = self.client.get('/api/tags/').data
+        self.assertCached('/api/tags/', tags)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Ужин'
+            self.tag.save()
+        self.assertEqual(self.client.get('/api/tags/').data[0]['name'],
+                         'Ужин')
+
+    def test_authenticated_requests_are_not_cached(self):
+        self.client.force_authenticate(self.user)
+        self.client.get('/api/recipes/')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/recipes/')
+        self.assertGreater(len(queries), 0)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_TOKEN='secret')
+    def test_metrics(self):
+        self.client.get('/api/ingredients/')
+        response = self.client.get('/api/ingredients/')
+        self.assertIn('cache;desc="hit"', response['Server-Timing'])
+        text = self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer secret'
+        ).content.decode()
+        for result in ('hit', 'miss'):
+            self.assertIn(
+                'foodgram_response_cache_total'
+                f'{{view="ingredients",result="{result}"}} 1', text
+            )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_without_request_timing(self):
+        self.client.get('/api/ingredients/')
+        response = self.client.get('/api/ingredients/')
+        self.assertNotIn('Server-Timing', response)
+        text = self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer secret'
+        ).content.decode()
+        for result in ('hit', 'miss'):
+            self.assertIn(
+                'foodgram_response_cache_total'
+                f'{{view="ingredients",result="{result}"}} 1', text
+            )
+
+
+class RepresentationParityTest(APITestCase):
+    """Быстрый вывод списков и orjson дают те же байты,
+    что сериализаторы и JSONRenderer.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.org', password='pass',
+            first_name='Читатель',
+        )
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.org', password='pass'
+        )
+        tags = [
+            Tag.objects.create(name=name, color='#FF0000', slug=slug)
+            for name, slug in (('Завтрак', 'breakfast'), ('Обед', 'lunch'))
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        for i, author in enumerate((cls.author, cls.user, cls.author)):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт «{i}»',
+                image='recipes/dish.jpg' if i else '',
+                image_variants=[100, 320] if i == 1 else [],
+                text='Строка\u2028"кавычки"', cooking_time=i + 1,
+            )
+            recipe.tags.set(tags[i % 2:])
+            for amount, ingredient in enumerate(reversed(ingredients[i:])):
+                AmountIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount + 1
+                )
+        Favorite.objects.create(user=cls.user, recipe=recipe)
+        ShoppingList.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def make_request(self, user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        return request
+
+    def assertSameBytes(self, expected, fast):
+        self.assertEqual(JSONRenderer().render(expected),
+                         ORJSONRenderer().render(fast))
+
+    def test_recipes(self):
+        for user in (self.user, AnonymousUser()):
+            request = self.make_request(user)
+            expected = ListRecipeSerializer(
+                Recipe.objects.with_related(), many=True,
+                context={'request': request},
+            ).data
+            fast = representations.recipes(list(Recipe.objects.all()),
+                                           request)
+            self.assertSameBytes(expected, fast)
+
+    def test_recipe_without_author(self):
+        Recipe.objects.create(author=None, name='Без автора',
+                              image='recipes/dish.jpg', text='Описание')
+        request = self.make_request(self.user)
+        expected = ListRecipeSerializer(
+            Recipe.objects.with_related(), many=True,
+            context={'request': request},
+        ).data
+        self.assertIsNone(expected[0]['author'])
+        self.assertSameBytes(
+            expected,
+            representations.recipes(list(Recipe.objects.all()), request)
+        )
+
+    def test_users(self):
+        request = self.make_request(self.user)
+        expected = UserSerializer(User.objects.all(), many=True,
+                                  context={'request': request}).data
+        fast = representations.users(User.objects.all(), request)
+        self.assertSameBytes(expected, fast)
+
+    def test_api_response(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/recipes/')
+        expected = ListRecipeSerializer(
+            Recipe.objects.with_related(), many=True,
+            context={'request': response.wsgi_request},
+        ).data
+        self.assertEqual(response.json()['results'],
+                         json.loads(JSONRenderer().render(expected)))
+
+    def test_renderer(self):
+        data = {
+            'decimal': Decimal('1.50'),
+            'date': datetime(2023, 1, 2, 3, 4, 5, 678901,
+                             tzinfo=timezone.utc),
+            'lazy': gettext_lazy('Рецепт'),
+            1: ['\u2029', 'текст', None, True, 2.5],
+        }
+        self.assertSameBytes(data, data)
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        media_type = 'application/json; indent=2'
+        self.assertEqual(JSONRenderer().render(data, media_type),
+                         ORJSONRenderer().render(data, media_type))
+
+    def test_parser(self):
+        body = '{"name":"Суп","tags":[1,2],"image":null}'.encode()
+        self.assertEqual(ORJSONParser().parse(BytesIO(body)),
+                         JSONParser().parse(BytesIO(body)))
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{"name":'))
+
+
+class RecipeDetailTest(APITestCase):
+    """Рецепт отдаётся сериализатором для чтения с общим планом полей
+    за одинаковое число запросов при любом числе ингредиентов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.org', password='pass'
+        )
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.org', password='pass'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#00FF00',
+                                     slug='lunch')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(10)
+        ]
+        cls.small, cls.large = (
+            Recipe.objects.create(
+                author=cls.author, name=name, image='recipes/soup.jpg',
+                text='Описание', cooking_time=10,
+            ) for name in ('Чай', 'Суп')
+        )
+        for recipe, ingredients in ((cls.small, cls.ingredients[:1]),
+                                    (cls.large, cls.ingredients)):
+            recipe.tags.set([cls.tag])
+            for ingredient in ingredients:
+                AmountIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=5
+                )
+        Favorite.objects.create(user=cls.reader, recipe=cls.large)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.reader)
+
+    def count_queries(self, recipe):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.data
+
+    def test_queries_do_not_depend_on_ingredients(self):
+        small, _ = self.count_queries(self.small)
+        large, data = self.count_queries(self.large)
+        self.assertEqual(small, large)
+        self.assertEqual(len(data['ingredients']), 10)
+
+    def test_fields_are_built_once(self):
+        RecipeDetailSerializer.get_plan()
+        with mock.patch.object(RecipeDetailSerializer, 'get_fields',
+                               side_effect=AssertionError):
+            response = self.client.get(f'/api/recipes/{self.large.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_matches_list_item(self):
+        results = self.client.get('/api/recipes/').data['results']
+        detail = self.client.get(f'/api/recipes/{self.large.id}/').json()
+        item = next(item for item in results if item['id'] == self.large.id)
+        self.assertEqual(detail, json.loads(json.dumps(item)))
+        self.assertTrue(detail['is_favorited'])
+
+    def test_context_is_not_shared(self):
+        flags = []
+        for user in (self.reader, self.author):
+            request = Request(APIRequestFactory().get('/'))
+            request.user = user
+            flags.append(RecipeDetailSerializer(
+                self.large, context={'request': request}
+            ).data['is_favorited'])
+        self.assertEqual(flags, [True, False])
+
+    def test_write_response(self):
+        self.client.force_authenticate(self.author)
+        payload = [
+            {'id': ingredient.id, 'amount': i + 1}
+            for i, ingredient in enumerate(reversed(self.ingredients[:3]))
+        ]
+        response = self.client.patch(
+            f'/api/recipes/{self.small.id}/',
+            {'ingredients': payload, 'tags': [self.tag.id]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {item['id']: (item['amount'], item['name'])
+             for item in response.data['ingredients']},
+            {ingredient.id: (i + 1, ingredient.name) for i, ingredient
+             in enumerate(reversed(self.ingredients[:3]))}
+        )
+        self.assertEqual(response.data['tags'][0]['slug'], 'lunch')
+        self.assertEqual(
+            response.json(),
+            self.client.get(f'/api/recipes/{self.small.id}/').json()
+        )
+
+
+class ShoppingTotalsTest(APITestCase):
+    """Итоги списков покупок меняются вместе со списками
+    и ингредиентами рецептов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.org', password='pass'
+        )
+        cls.buyer = User.objects.create_user(
+            username='buyer', email='buyer@example.org', password='pass'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#00FF00',
+                                     slug='lunch')
+        cls.potato, cls.salt, cls.oil = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Картофель', 'Соль', 'Масло')
+        )
+        cls.soup, cls.fries = (
+            Recipe.objects.create(
+                author=cls.author, name=name, image='recipes/soup.jpg',
+                text='Описание', cooking_time=10,
+            ) for name in ('Суп', 'Картофель фри')
+        )
+        for recipe, amounts in ((cls.soup, ((cls.potato, 300),
+                                            (cls.salt, 5))),
+                                (cls.fries, ((cls.potato, 200),
+                                             (cls.oil, 50)))):
+            recipe.tags.set([cls.tag])
+            for ingredient, amount in amounts:
+                AmountIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+
+    def setUp(self):
+        cache.clear()
+
+    def assertTotals(self, user, expected):
+        self.assertEqual(
+            dict(ShoppingListTotal.objects.filter(
+                user=user, total__gt=0
+            ).values_list('ingredient__name', 'total')),
+            expected
+        )
+        self.assertEqual(totals.verify(), {})
+
+    def test_cart_changes(self):
+        self.client.force_authenticate(self.buyer)
+        for recipe in (self.soup, self.fries):
+            response = self.client.post(
+                f'/api/recipes/{recipe.id}/shopping_cart/'
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertTotals(self.buyer, {
+            'Картофель': 500, 'Соль': 5, 'Масло': 50,
+        })
+        response = self.client.delete(
+            f'/api/recipes/{self.soup.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertTotals(self.buyer, {'Картофель': 200, 'Масло': 50})
+
+    def test_recipe_edits(self):
+        for user in (self.author, self.buyer):
+            ShoppingList.objects.create(user=user, recipe=self.soup)
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(f'/api/recipes/{self.soup.id}/', {
+            'ingredients': [{'id': self.potato.id, 'amount': 400},
+                            {'id': self.oil.id, 'amount': 10}],
+            'tags': [self.tag.id],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        for user in (self.author, self.buyer):
+            self.assertTotals(user, {'Картофель': 400, 'Масло': 10})
+
+        amount = AmountIngredient.objects.get(recipe=self.soup,
+                                              ingredient=self.oil)
+        amount.ingredient = self.salt
+        amount.amount = 7
+        amount.save()
+        self.assertTotals(self.buyer, {'Картофель': 400, 'Соль': 7})
+        amount.delete()
+        self.assertTotals(self.buyer, {'Картофель': 400})
+
+    def test_recipe_delete(self):
+        for recipe in (self.soup, self.fries):
+            ShoppingList.objects.create(user=self.buyer, recipe=recipe)
+        self.soup.delete()
+        self.assertTotals(self.buyer, {'Картофель': 200, 'Масло': 50})
+
+    def test_download_reads_totals(self):
+        ShoppingList.objects.create(user=self.buyer, recipe=self.soup)
+        self.client.force_authenticate(self.buyer)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/'
+            )
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn(AmountIngredient._meta.db_table,
+                         context.captured_queries[0]['sql'])
+        self.assertIn('Картофель, 300 г', content)
+
+    def test_rebuild_command(self):
+        ShoppingList.objects.create(user=self.buyer, recipe=self.soup)
+        ShoppingListTotal.objects.filter(ingredient=self.potato).update(
+            total=1
+        )
+        ShoppingListTotal.objects.filter(ingredient=self.salt).delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_totals', '--check',
+                         stdout=StringIO())
+        out = StringIO()
+        call_command('rebuild_shopping_totals', stdout=out)
+        self.assertIn('исправлено расхождений: 2', out.getvalue())
+        self.assertTotals(self.buyer, {'Картофель': 300, 'Соль': 5})
+        call_command('rebuild_shopping_totals', '--check', stdout=out)
+
+
+class FeedTest(APITestCase):
+    """Лента подписок: чтение по подпискам и готовые ленты
+    дают одинаковый результат.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.org', password='pass'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.org',
+                password='pass'
+            ) for i in range(3)
+        ]
+        for i in range(9):
+            Recipe.objects.create(
+                author=cls.authors[i % 3], name=f'Рецепт {i}',
+                image='recipes/soup.jpg', text='Описание', cooking_time=5,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.reader)
+
+    def follow(self, *authors):
+        for author in authors:
+            Follow.objects.create(user=self.reader, author=author)
+        self.reader.refresh_from_db()
+
+    def expected(self, *authors):
+        return list(Recipe.objects.filter(author__in=authors).order_by(
+            '-pub_date', '-pk'
+        ).values_list('id', flat=True))
+
+    def read_feed(self, limit=2):
+        ids = []
+        url = f'/api/recipes/feed/?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    @override_settings(FEED_TIMELINE_THRESHOLD=100)
+    def test_fan_out_on_read(self):
+        self.follow(*self.authors[:2])
+        self.assertEqual(self.read_feed(), self.expected(*self.authors[:2]))
+        self.assertFalse(FeedEntry.objects.exists())
+
+    @override_settings(FEED_TIMELINE_THRESHOLD=2)
+    def test_timeline(self):
+        self.follow(self.authors[0])
+        self.assertFalse(FeedEntry.objects.exists())
+        self.follow(self.authors[1])
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(),
+                         6)
+        self.follow(self.authors[2])
+        recipe = Recipe.objects.create(
+            author=self.authors[2], name='Новый', image='recipes/soup.jpg',
+            text='Описание', cooking_time=5,
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/feed/?limit=3')
+        self.assertEqual(response.data['results'][0]['id'], recipe.id)
+        page_query = next(
+            query['sql'] for query in context.captured_queries
+            if FeedEntry._meta.db_table in query['sql']
+        )
+        self.assertNotIn(Follow._meta.db_table, page_query)
+        self.assertEqual(self.read_feed(), self.expected(*self.authors))
+
+        Follow.objects.get(user=self.reader, author=self.authors[2]).delete()
+        self.assertEqual(self.read_feed(), self.expected(*self.authors[:2]))
+        Follow.objects.get(user=self.reader, author=self.authors[1]).delete()
+        self.assertFalse(FeedEntry.objects.exists())
+        self.reader.refresh_from_db()
+        self.assertEqual(self.read_feed(), self.expected(self.authors[0]))
+
+    def test_cursor_survives_strategy_switch(self):
+        self.follow(*self.authors)
+        with override_settings(FEED_TIMELINE_THRESHOLD=100):
+            first = self.client.get('/api/recipes/feed/?limit=4').data
+        with override_settings(FEED_TIMELINE_THRESHOLD=1):
+            call_command('rebuild_feeds', stdout=StringIO())
+            cache.clear()
+            second = self.client.get(first['next']).data
+        ids = [item['id'] for item in first['results'] + second['results']]
+        self.assertEqual(ids, self.expected(*self.authors)[:8])
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/recipes/feed/').status_code,
+                         401)
@@ -0,0 +1,118 @@
+from django.db.models import BigIntegerField, Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .models import AmountIngredient, ShoppingList, ShoppingListTotal
+
+BATCH_SIZE = 1000
+
+
+def change(user_ids, deltas):
+    """Прибавляет `deltas` ({id ингредиента: изменение}) к итогам
+    списков покупок пользователей `user_ids`: недостающие строки
+    создаются одним `bulk_create`, суммы меняются одним UPDATE
+    выражением F(). Итог не уходит ниже нуля, даже если разошёлся
+    с данными.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not user_ids or not deltas:
+        return
+    added = [pk for pk, delta in deltas.items() if delta > 0]
+    if added:
+        ShoppingListTotal.objects.bulk_create(
+            (ShoppingListTotal(user_id=user_id, ingredient_id=pk)
+             for user_id in user_ids for pk in added),
+            batch_size=BATCH_SIZE, ignore_conflicts=True,
+        )
+    ShoppingListTotal.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas
+    ).update(total=Greatest(F('total') + Case(
+        *(When(ingredient_id=pk, then=Value(delta))
+          for pk, delta in deltas.items()),
+        output_field=BigIntegerField(),
+    ), Value(0)))
+
+
+def recipe_amounts(recipe_id, sign=1):
+    return {
+        ingredient_id: sign * amount
+        for ingredient_id, amount in AmountIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount')
+    }
+
+
+def add_recipe(user_id, recipe_id):
+    """Рецепт добавлен в список покупок пользователя."""
+    change((user_id,), recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    """Рецепт убран из списка покупок пользователя."""
+    change((user_id,), recipe_amounts(recipe_id, sign=-1))
+
+
+def change_recipe(recipe_id, deltas):
+    """Ингредиенты рецепта изменились на `deltas`: изменение
+    получают все, у кого рецепт в списке покупок.
+    """
+    if not any(deltas.values()):
+        return
+    change(list(ShoppingList.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True)), deltas)
+
+
+def actual():
+    """Итоги, посчитанные заново по спискам покупок:
+    {(id пользователя, id ингредиента): сумма}.
+    """
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in AmountIngredient.objects.filter(
+            recipe__purchases__isnull=False
+        ).values_list(
+            'recipe__purchases__user_id', 'ingredient_id'
+        ).annotate(total=Sum('amount')).order_by()
+    }
+
+
+def stored():
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total
+        in ShoppingListTotal.objects.filter(total__gt=0).values_list(
+            'user_id', 'ingredient_id', 'total'
+        )
+    }
+
+
+def compare(expected, current):
+    return {
+        key: (current.get(key, 0), expected.get(key, 0))
+        for key in expected.keys() | current.keys()
+        if current.get(key, 0) != expected.get(key, 0)
+    }
+
+
+def verify():
+    """Расхождения сохранённых итогов с пересчётом:
+    {(id пользователя, id ингредиента): (сохранено, должно быть)}.
+    """
+    return compare(actual(), stored())
+
+
+def rebuild():
+    """Заменяет итоги пересчитанными, заодно удаляя нулевые строки.
+    Возвращает расхождения, которые были до пересчёта.
+    Вызывать в транзакции.
+    """
+    expected = actual()
+    differences = compare(expected, stored())
+    ShoppingListTotal.objects.all().delete()
+    ShoppingListTotal.objects.bulk_create(
+        (ShoppingListTotal(user_id=user_id, ingredient_id=ingredient_id,
+                           total=total)
+         for (user_id, ingredient_id), total in expected.items()),
+        batch_size=BATCH_SIZE,
+    )
+    return differences
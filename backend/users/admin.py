@@ -1,12 +1,13 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from recipes.admin_tools import ScalableAdminMixin
 
 from .forms import UserChangeForm, UserCreationForm
 from .models import CustomUser
 
 
 @admin.register(CustomUser)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(ScalableAdminMixin, BaseUserAdmin):
     form = UserChangeForm
     add_form = UserCreationForm
 
@@ -16,9 +17,11 @@ class UserAdmin(BaseUserAdmin):
         'email',
         'first_name',
         'last_name',
+        'recipes_count',
+        'followers_count',
     )
     list_display_links = ('email',)
     search_fields = ('username', 'email',)
-    list_filter = ('username', 'email')
+    list_filter = ('is_staff', 'is_active')
     ordering = ('email',)
     empty_value_display = '-пусто-'
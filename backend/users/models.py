@@ -1,5 +1,5 @@
 from django.contrib.auth.models import AbstractUser
-from django.db.models import CharField, EmailField
+from django.db.models import CharField, EmailField, PositiveIntegerField
 
 
 class CustomUser(AbstractUser):
@@ -29,6 +29,25 @@ class CustomUser(AbstractUser):
         verbose_name='password',
         max_length=150
     )
+    recipes_count = PositiveIntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False,
+    )
+    following_count = PositiveIntegerField(
+        verbose_name='Подписок',
+        default=0,
+        editable=False,
+    )
+
+    # Счётчики меняются только запросами update(): обычное
+    # сохранение их не записывает.
+    derived_fields = ('recipes_count', 'followers_count', 'following_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
@@ -40,3 +59,12 @@ class CustomUser(AbstractUser):
 
     def __str__(self):
         return f'{self.username}: {self.email}'
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.derived_fields
+            ]
+        super().save(*args, **kwargs)
@@ -1,9 +1,11 @@
+from api.fields import ImageSrcsetField
 from django.contrib.auth import get_user_model
 from djoser.conf import settings
 from djoser.serializers import (SetPasswordSerializer, UserCreateSerializer,
                                 UserSerializer)
 from drf_extra_fields.fields import Base64ImageField
-from recipes.models import Follow, Recipe
+from recipes import memberships
+from recipes.models import Recipe
 from rest_framework import serializers
 
 User = get_user_model()
@@ -27,12 +29,11 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ('is_subscribed',)
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Follow.objects.filter(
-            user=request.user,
-            author=obj.id).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in memberships.for_request(
+            self.context.get('request')
+        ).following
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -63,10 +64,11 @@ class SimpleRecipeSerializer(serializers.ModelSerializer):
     """
 
     image = Base64ImageField()
+    image_srcset = ImageSrcsetField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
 
 
 class UserSubscribeSerializer(UserSerializer):
@@ -76,13 +78,9 @@ class UserSubscribeSerializer(UserSerializer):
     """
 
     recipes = SimpleRecipeSerializer(many=True)
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + (
             'recipes',
             'recipes_count',
         )
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
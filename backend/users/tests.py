@@ -1,3 +1,96 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from recipes.models import Follow, Recipe
+from rest_framework.test import APITestCase
+
+User = get_user_model()
+
+
+class SubscriptionsTest(APITestCase):
+    """Список подписок и подписка на автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.org', password='pass'
+        )
+        cls.authors = []
+        now = timezone.now()
+        for number in range(3):
+            author = User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.org',
+                password='pass',
+            )
+            cls.authors.append(author)
+            for index in range(4):
+                recipe = Recipe.objects.create(
+                    author=author, name=f'Рецепт {number}-{index}',
+                    image='recipes/test.jpg', text='Описание',
+                    cooking_time=10,
+                )
+                Recipe.objects.filter(id=recipe.id).update(
+                    pub_date=now - timedelta(days=4 - index)
+                )
+        for author in cls.authors[:2]:
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_limit_and_counts(self):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        for item in response.data['results']:
+            self.assertTrue(item['is_subscribed'])
+            self.assertEqual(item['recipes_count'], 4)
+            self.assertEqual(
+                [recipe['name'] for recipe in item['recipes']],
+                [f'Рецепт {item["username"][-1]}-{index}'
+                 for index in (3, 2)]
+            )
+
+    def test_queries_do_not_depend_on_page_size(self):
+        for number in range(3, 8):
+            author = User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.org',
+                password='pass',
+            )
+            Recipe.objects.create(
+                author=author, name='Рецепт', image='recipes/test.jpg',
+                text='Описание', cooking_time=10,
+            )
+            Follow.objects.create(user=self.user, author=author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/users/subscriptions/', {'recipes_limit': 3}
+            )
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertLessEqual(len(queries), 3)
+
+    def test_invalid_recipes_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 'all'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_subscribe_respects_recipes_limit(self):
+        author = self.authors[2]
+        response = self.client.post(
+            f'/api/users/{author.id}/subscribe/?recipes_limit=1'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['is_subscribed'])
+        self.assertEqual(response.data['recipes_count'], 4)
+        self.assertEqual(len(response.data['recipes']), 1)
+        self.assertTrue(
+            Follow.objects.filter(user=self.user, author=author).exists()
+        )
@@ -1,11 +1,15 @@
+from api import representations
+from api.metrics import SerializerTimingMixin, measure, timed
 from api.paginators import PageLimitPagination
 from api.permissions import OwnerOrAdminOrReadOnly
 from django.conf import settings as django_settings
 from django.contrib.auth import get_user_model
+from django.db.models import OuterRef, Prefetch, Subquery, Value
 from djoser.views import UserViewSet as DjoserUserViewSet
-from recipes.models import Follow
+from recipes.models import Follow, Recipe
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -15,12 +19,53 @@ from .serializers import UserSerializer, UserSubscribeSerializer
 User = get_user_model()
 
 
-class UserViewSet(DjoserUserViewSet):
+class UserViewSet(SerializerTimingMixin, DjoserUserViewSet):
     queryset = User.objects.all()
     pagination_class = PageLimitPagination
     serializer_class = UserSerializer
     permission_classes = (OwnerOrAdminOrReadOnly,)
 
+    def list(self, request, *args, **kwargs):
+        """Список пользователей без `UserSerializer`: вывод
+        собирается в `representations.users`.
+        """
+        page = self.paginate_queryset(self.filter_queryset(
+            self.get_queryset()
+        ))
+        with measure('serialize'):
+            data = representations.users(page, request)
+        return self.get_paginated_response(data)
+
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise ValidationError(
+                {'recipes_limit': 'Укажите неотрицательное целое число.'}
+            )
+        return recipes_limit
+
+    def with_subscription_data(self, queryset):
+        """Авторы с последними рецептами (не больше `recipes_limit`
+        на автора) за два запроса на всю страницу.
+        """
+        recipes = Recipe.objects.all()
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).order_by('-pub_date', '-pk').values('pk')[:recipes_limit]
+            ))
+        return queryset.annotate(
+            is_subscribed=Value(True),
+        ).prefetch_related(Prefetch('recipes', queryset=recipes))
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
@@ -39,11 +84,13 @@ class UserViewSet(DjoserUserViewSet):
             if user == author:
                 return Response({'error': 'Невозможно подписаться на себя'},
                                 status=status.HTTP_400_BAD_REQUEST)
-        
-            serializer = UserSubscribeSerializer(
-                author, context={'request': request}
-            )
+            author = self.with_subscription_data(
+                User.objects.filter(id=author.id)
+            ).get()
             Follow.objects.create(user=user, author=author)
+            serializer = timed(UserSubscribeSerializer(
+                author, context={'request': request}
+            ))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
@@ -59,11 +106,13 @@ class UserViewSet(DjoserUserViewSet):
     )
     def subscriptions(self, request):
         user = request.user
-        queryset = User.objects.filter(following__user=user)
+        queryset = self.with_subscription_data(
+            User.objects.filter(following__user=user)
+        ).order_by('username')
         pages = self.paginate_queryset(queryset)
-        serializer = UserSubscribeSerializer(
+        serializer = timed(UserSubscribeSerializer(
             pages,
             many=True,
             context={'request': request}
-        )
+        ))
         return self.get_paginated_response(serializer.data)